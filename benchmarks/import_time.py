@@ -0,0 +1,86 @@
+#!/usr/bin/python
+''' Start up benchmark: cost of importing ssh_paramiko and creating a RemoteServer
+
+Usage::
+
+    $ python benchmarks/import_time.py --budget 100 --output startup.json
+
+Each run is a fresh interpreter. The script exits with status 1 if the best run exceeds
+the budget, or if paramiko or asyncio are imported before any connection is made.
+
+'''
+import argparse
+import compileall
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+PROBE = '''
+import json, sys, time
+start = time.time()
+import ssh_paramiko
+imported = time.time()
+remote_server = ssh_paramiko.RemoteServer('unused_key')
+remote_server.log
+created = time.time()
+print(json.dumps({'import': imported - start, 'construct': created - imported,
+                  'heavy_modules': [name for name in ('paramiko', 'asyncio', 'cryptography')
+                                    if name in sys.modules]}))
+'''
+
+
+def run_probe():
+    '''Runs the probe in a new interpreter, returning its measures and wall time'''
+    start = time.time()
+    output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=ROOT)
+    measures = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+    measures['process'] = time.time() - start
+    return measures
+
+
+def run_baseline():
+    '''Wall time of an interpreter that imports nothing'''
+    start = time.time()
+    subprocess.check_call([sys.executable, '-c', 'pass'])
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=10,
+                        help='number of interpreters started (default: 10)')
+    parser.add_argument('--budget', type=float, default=100,
+                        help='maximum import plus construction time, in ms (default: 100)')
+    parser.add_argument('--output', default=None,
+                        help='file where the JSON results are written (default: stdout)')
+    args = parser.parse_args()
+    # installed packages are byte-compiled, so the probe must not measure compilation
+    compileall.compile_dir(os.path.join(ROOT, 'ssh_paramiko'), quiet=1)
+    probes = [run_probe() for _ in range(args.runs)]
+    baseline = min(run_baseline() for _ in range(args.runs))
+    best = min(probes, key=lambda probe: probe['import'] + probe['construct'])
+    report = {
+        'python': sys.version.split()[0],
+        'runs': args.runs,
+        'budget_ms': args.budget,
+        'import_ms': best['import'] * 1000,
+        'construct_ms': best['construct'] * 1000,
+        'process_overhead_ms': (min(probe['process'] for probe in probes) - baseline) * 1000,
+        'heavy_modules': best['heavy_modules']
+        }
+    report['passed'] = report['import_ms'] + report['construct_ms'] <= args.budget and \
+        not report['heavy_modules']
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output+'\n')
+    else:
+        print(output)
+    sys.exit(0 if report['passed'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/python
+''' Benchmarks of the hot paths of ssh_paramiko against a local ssh/sftp server stand-in
+
+Usage::
+
+    $ python benchmarks/run_benchmarks.py --rtt 20 --bandwidth 50 --output results.json
+
+The results are written as JSON, so the runs of different releases can be compared.
+The tuning benchmark transfers a file with the paramiko default window, packet size and
+prefetch depth and with larger ones; run it with --rtt to see the gain on long links
+(uploads are bound by the receive window of the server, which the client can't change).
+The fleet benchmark runs a command in --fleet-hosts servers, one per loopback address
+(Linux only), serially and with FleetExecutor.
+
+'''
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import paramiko
+from ssh_paramiko import FleetExecutor, MetricsRegistry, RemoteServer, RemoteServerPool
+from ssh_paramiko.hostkeys import KnownHostsStore
+from server import BenchmarkServer
+
+SERVER = '127.0.0.1'
+
+
+def new_remote_server(port, metrics=None, **kwargs):
+    '''Creates a :class:`RemoteServer` for the benchmark server'''
+    # every benchmark server has a new host key, and its port may be reused by a later one
+    kwargs.setdefault('known_hosts', KnownHostsStore())
+    return RemoteServer(None, username='benchmark', password='benchmark', ssh_port=port,
+                        server_has_dns=False, metrics=metrics, **kwargs)
+
+
+def summarize(durations):
+    '''Mean, minimum and maximum of a list of durations'''
+    return {'mean': sum(durations) / len(durations), 'min': min(durations),
+            'max': max(durations), 'runs': len(durations)}
+
+
+def bench_connect(port, runs):
+    '''Seconds taken by connect_server, with the sftp session separate and shared'''
+    results = {}
+    for name, shared in (('separate_sftp', False), ('shared_sftp', True)):
+        durations = []
+        for _ in range(runs):
+            remote_server = new_remote_server(port, sftp_shared_transport=shared)
+            start = time.time()
+            ret, msg = remote_server.connect_server(SERVER)
+            if shared and ret:
+                remote_server.get_sftp_client()
+            durations.append(time.time() - start)
+            if not ret:
+                raise RuntimeError('Could not connect to the benchmark server: '+msg)
+            remote_server.close_connection()
+        results[name] = summarize(durations)
+    return results
+
+
+def bench_commands(remote_server, count):
+    '''Commands per second of execute_cmd, execute_shell_cmd and execute_batch'''
+    results = {}
+    for name, run in (('execute_cmd', lambda: [remote_server.execute_cmd('true')
+                                               for _ in range(count)]),
+                      ('execute_shell_cmd', lambda: [remote_server.execute_shell_cmd('true')
+                                                     for _ in range(count)]),
+                      ('execute_batch', lambda: remote_server.execute_batch(['true'] * count))):
+        start = time.time()
+        outcomes = run()
+        duration = time.time() - start
+        if not all(outcome[0] for outcome in outcomes):
+            raise RuntimeError(name+' failed in the benchmark server')
+        results[name] = {'commands_per_second': count / duration, 'commands': count}
+    remote_server.close_shell()
+    return results
+
+
+def bench_transfers(remote_server, sizes, work_dir):
+    '''Throughput (MB/s) of put_file and get_file and cost of validate_files per file size'''
+    results = {}
+    for size in sizes:
+        local_path = os.path.join(work_dir, 'local_'+str(size))
+        remote_path = os.path.join(work_dir, 'remote_'+str(size))
+        with open(local_path, 'wb') as local_file:
+            local_file.write(os.urandom(size))
+        result = {}
+        for name, transfer in (('put_file', remote_server.put_file),
+                               ('get_file', remote_server.get_file)):
+            start = time.time()
+            if not transfer(local_path, remote_path):
+                raise RuntimeError(name+' failed in the benchmark server')
+            duration = time.time() - start
+            result[name] = {'seconds': duration, 'mb_per_second': size / 1048576.0 / duration}
+        start = time.time()
+        if not remote_server.validate_files(local_path, remote_path):
+            raise RuntimeError('validate_files failed in the benchmark server')
+        result['validate_files'] = dict(remote_server.last_validation,
+                                        seconds=time.time() - start)
+        results[str(size)] = result
+        os.remove(local_path)
+        os.remove(remote_path)
+    return results
+
+
+# transport and sftp settings compared with the paramiko defaults by bench_tuning
+TUNED_SETTINGS = {'window_size': 16 * 1048576, 'max_packet_size': 32768, 'prefetch_depth': 1024}
+
+
+def bench_tuning(port, size, work_dir):
+    '''Throughput (MB/s) of put_file and get_file with the default and the tuned window, packet
+    size and prefetch depth (see TUNED_SETTINGS)'''
+    results = {}
+    local_path = os.path.join(work_dir, 'tuning_local')
+    remote_path = os.path.join(work_dir, 'tuning_remote')
+    with open(local_path, 'wb') as local_file:
+        local_file.write(os.urandom(size))
+    for name, settings in (('default', {}), ('tuned', TUNED_SETTINGS)):
+        remote_server = new_remote_server(port, **settings)
+        ret, msg = remote_server.connect_server(SERVER)
+        if not ret:
+            raise RuntimeError('Could not connect to the benchmark server: '+msg)
+        result = dict(settings)
+        for transfer_name, transfer in (('put_file', remote_server.put_file),
+                                        ('get_file', remote_server.get_file)):
+            start = time.time()
+            if not transfer(local_path, remote_path):
+                raise RuntimeError(transfer_name+' failed in the benchmark server')
+            result[transfer_name] = size / 1048576.0 / (time.time() - start)
+        remote_server.close_connection()
+        results[name] = result
+    for transfer_name in ('put_file', 'get_file'):
+        results[transfer_name+'_speedup'] = results['tuned'][transfer_name] / \
+            results['default'][transfer_name]
+    results['bytes'] = size
+    os.remove(local_path)
+    os.remove(remote_path)
+    return results
+
+
+def bench_fleet(rtt, bandwidth, hosts, workers):
+    '''Seconds taken to run a command in many servers, serially and with FleetExecutor
+
+    Each server is a loopback address of its own benchmark server, behind the same latency.
+
+    '''
+    results = {}
+    with BenchmarkServer(rtt, bandwidth, hosts) as server:
+        server_args = {'username': 'benchmark', 'password': 'benchmark',
+                       'ssh_port': server.port, 'server_has_dns': False,
+                       'known_hosts': KnownHostsStore()}
+        start = time.time()
+        for host in server.hosts:
+            remote_server = new_remote_server(server.port,
+                                              known_hosts=server_args['known_hosts'])
+            ret, msg = remote_server.connect_server(host)
+            if not ret or not remote_server.execute_cmd('true')[0]:
+                raise RuntimeError('Could not run a command in '+host+': '+msg)
+            remote_server.close_connection()
+        results['serial'] = {'seconds': time.time() - start}
+        with RemoteServerPool(max_size=hosts, server_args=server_args) as pool:
+            for name, fleet_pool in (('fleet', None), ('fleet_cold_pool', pool),
+                                     ('fleet_warm_pool', pool)):
+                fleet = FleetExecutor(None, max_workers=workers, pool=fleet_pool,
+                                      server_args=server_args)
+                start = time.time()
+                outcomes = list(fleet.execute_cmd(server.hosts, 'true'))
+                if not all(outcome[1][0] for outcome in outcomes):
+                    raise RuntimeError(name+' failed in the benchmark servers')
+                results[name] = {'seconds': time.time() - start}
+    for result in results.values():
+        result['hosts_per_second'] = hosts / result['seconds']
+    results.update({'hosts': hosts, 'workers': workers})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--rtt', type=float, default=0,
+                        help='round trip time added to the connections, in ms (default: 0)')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='bandwidth of the connections, in MB/s (default: unlimited)')
+    parser.add_argument('--connects', type=int, default=10,
+                        help='number of connections measured (default: 10)')
+    parser.add_argument('--commands', type=int, default=200,
+                        help='number of commands measured (default: 200)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 1024, 16384],
+                        help='sizes of the transfered files, in KB (default: 64 1024 16384)')
+    parser.add_argument('--tuning-size', type=int, default=32768,
+                        help='size of the file transfered with the default and the tuned '
+                             'window settings, in KB (default: 32768, 0 skips it)')
+    parser.add_argument('--fleet-hosts', type=int, default=16,
+                        help='number of servers of the fleet benchmark, as loopback addresses '
+                             '(default: 16, 0 skips it)')
+    parser.add_argument('--fleet-workers', type=int, default=8,
+                        help='servers handled at the same time by FleetExecutor (default: 8)')
+    parser.add_argument('--output', default=None,
+                        help='file where the JSON results are written (default: stdout)')
+    args = parser.parse_args()
+    bandwidth = args.bandwidth * 1048576 if args.bandwidth else None
+    work_dir = tempfile.mkdtemp(prefix='ssh_paramiko_benchmark_')
+    metrics = MetricsRegistry()
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'paramiko': paramiko.__version__,
+        'platform': platform.platform(),
+        'rtt_ms': args.rtt,
+        'bandwidth_mb_per_second': args.bandwidth
+        }
+    try:
+        with BenchmarkServer(args.rtt / 1000.0, bandwidth) as server:
+            report['connect_server'] = bench_connect(server.port, args.connects)
+            remote_server = new_remote_server(server.port, metrics)
+            ret, msg = remote_server.connect_server(SERVER)
+            if not ret:
+                raise RuntimeError('Could not connect to the benchmark server: '+msg)
+            report['commands'] = bench_commands(remote_server, args.commands)
+            report['transfers'] = bench_transfers(remote_server,
+                                                  [size * 1024 for size in args.sizes],
+                                                  work_dir)
+            remote_server.close_connection()
+            if args.tuning_size:
+                report['tuning'] = bench_tuning(server.port, args.tuning_size * 1024, work_dir)
+        if args.fleet_hosts:
+            report['fleet'] = bench_fleet(args.rtt / 1000.0, bandwidth, args.fleet_hosts,
+                                          args.fleet_workers)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    report['phases'] = metrics.snapshot()
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output+'\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
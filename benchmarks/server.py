@@ -0,0 +1,433 @@
+#!/usr/bin/python
+''' In-process ssh/sftp server stand-in for the benchmarks
+
+The server accepts any user and password, runs exec requests as local shell commands and
+serves the local filesystem through sftp. A :class:`ThrottledLink` can be put in front of it
+to add latency and limit the bandwidth of the connections.
+
+'''
+import functools
+import logging
+import os
+import socket
+import subprocess
+import threading
+import time
+from collections import deque
+import paramiko
+
+# seconds a finished command waits for the client to close its channel
+CLOSE_TIMEOUT = 10
+
+# the tcp reachability probes of the clients end before the ssh banner exchange
+logging.getLogger('paramiko').addHandler(logging.NullHandler())
+
+
+class StubServer(paramiko.ServerInterface):
+    ''' Server interface accepting any credentials, with exec and sftp support
+
+    '''
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password,publickey'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        thread = threading.Thread(target=run_command, args=(channel, command))
+        thread.daemon = True
+        thread.start()
+        return True
+
+
+def run_command(channel, command):
+    '''Runs an exec request as a local shell command, relaying its streams and exit status
+
+    Arguments:
+        channel (:obj:`paramiko.Channel`): server side of the channel
+        command (:obj:`bytes`): requested command
+
+    '''
+    process = subprocess.Popen(command.decode('utf-8'), shell=True, stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def feed_stdin():
+        try:
+            while True:
+                data = channel.recv(32768)
+                if not data:
+                    break
+                process.stdin.write(data)
+                process.stdin.flush()
+        except (IOError, OSError, socket.error):
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except (IOError, OSError):
+                pass
+
+    def pump_stderr():
+        for data in iter(lambda: os.read(process.stderr.fileno(), 32768), b''):
+            channel.sendall_stderr(data)
+    stdin_thread = threading.Thread(target=feed_stdin)
+    stdin_thread.daemon = True
+    stdin_thread.start()
+    stderr_thread = threading.Thread(target=pump_stderr)
+    stderr_thread.daemon = True
+    stderr_thread.start()
+    try:
+        for data in iter(lambda: os.read(process.stdout.fileno(), 32768), b''):
+            channel.sendall(data)
+        stderr_thread.join()
+        channel.send_exit_status(process.wait())
+        # a quick command may end before the transport has acknowledged the exec request,
+        # and the client fails the request if the channel is closed first: the end of the
+        # output is signaled with eof, and the channel is closed by the client
+        channel.shutdown_write()
+        stdin_thread.join(CLOSE_TIMEOUT)
+    except socket.error:
+        process.kill()
+    finally:
+        channel.close()
+
+
+def set_file_attr(path, attr, file_object=None):
+    '''Applies sftp attributes to a local file
+
+    paramiko.SFTPServer.set_file_attr truncates a file by opening it with mode w+, which
+    empties it whatever the requested size, so the size is set with ftruncate here.
+
+    Arguments:
+        path (:obj:`str`): path of the file
+        attr (:obj:`paramiko.SFTPAttributes`): attributes to set
+        file_object (:obj:`file`, optional): open file object of the path, if any
+
+    '''
+    if attr._flags & attr.FLAG_PERMISSIONS:
+        os.chmod(path, attr.st_mode)
+    if attr._flags & attr.FLAG_UIDGID:
+        os.chown(path, attr.st_uid, attr.st_gid)
+    if attr._flags & attr.FLAG_AMTIME:
+        os.utime(path, (attr.st_atime, attr.st_mtime))
+    if attr._flags & attr.FLAG_SIZE:
+        if file_object is not None:
+            file_object.flush()
+            os.ftruncate(file_object.fileno(), attr.st_size)
+        else:
+            with open(path, 'r+b') as resized_file:
+                resized_file.truncate(attr.st_size)
+
+
+class StubSFTPHandle(paramiko.SFTPHandle):
+    ''' Handle of a local file opened through sftp
+
+    '''
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def chattr(self, attr):
+        try:
+            set_file_attr(self.filename, attr, self.writefile)
+            return paramiko.SFTP_OK
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+
+class StubSFTPServer(paramiko.SFTPServerInterface):
+    ''' Sftp interface serving the local filesystem
+
+    '''
+    def list_folder(self, path):
+        try:
+            attributes = []
+            for name in os.listdir(path):
+                attr = paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)))
+                attr.filename = name
+                attributes.append(attr)
+            return attributes
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def open(self, path, flags, attr):
+        try:
+            mode = getattr(attr, 'st_mode', None)
+            descriptor = os.open(path, flags, mode if mode is not None else 0o666)
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+        if flags & os.O_CREAT and attr is not None:
+            attr._flags &= ~attr.FLAG_PERMISSIONS
+            set_file_attr(path, attr)
+        if flags & os.O_WRONLY:
+            file_mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            file_mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            file_mode = 'rb'
+        handle = StubSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(descriptor, file_mode)
+        return handle
+
+    def remove(self, path):
+        return self._call(os.remove, path)
+
+    def rename(self, oldpath, newpath):
+        return self._call(os.rename, oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        return self._call(os.rename, oldpath, newpath)
+
+    def mkdir(self, path, attr):
+        return self._call(os.mkdir, path)
+
+    def rmdir(self, path):
+        return self._call(os.rmdir, path)
+
+    def chattr(self, path, attr):
+        return self._call(set_file_attr, path, attr)
+
+    def symlink(self, target_path, path):
+        return self._call(os.symlink, target_path, path)
+
+    def readlink(self, path):
+        try:
+            return os.readlink(path)
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    @staticmethod
+    def _call(function, *args):
+        '''Runs a filesystem operation, converting its errors to sftp codes'''
+        try:
+            function(*args)
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+        return paramiko.SFTP_OK
+
+
+class ThrottledLink(object):
+    ''' Tcp proxy that adds latency and limits bandwidth in front of a local port
+
+    Each direction of a connection is delayed by half the round trip time and paced to the
+    bandwidth; data already in flight does not wait for the previous chunks' delay, so the
+    link behaves like a long pipe rather than a stop-and-wait one.
+
+    Arguments:
+        target_port (:obj:`int`): local port the connections are relayed to
+        rtt (:obj:`float`): round trip time added to the connections, in seconds
+        bandwidth (:obj:`float`): bandwidth of each direction, in bytes per second (None
+            does not limit it)
+        addresses (:obj:`tuple`): local addresses the link listens on, all on the same port
+            (default: 127.0.0.1)
+
+    '''
+    def __init__(self, target_port, rtt=0, bandwidth=None, addresses=('127.0.0.1',)):
+        self.target_port = target_port
+        self.delay = rtt / 2.0
+        self.bandwidth = bandwidth
+        self.listeners = listen(addresses)
+        self.port = self.listeners[0].getsockname()[1]
+        for listener in self.listeners:
+            start_thread(functools.partial(self.accept, listener))
+
+    def accept(self, listener):
+        '''Relays every accepted connection to the target port'''
+        while True:
+            try:
+                client, _ = listener.accept()
+            except socket.error:
+                return
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.relay(client, upstream)
+            self.relay(upstream, client)
+
+    def relay(self, source, destination):
+        '''Forwards one direction of a connection through a delayed, paced queue'''
+        queue = deque()
+        ready = threading.Condition()
+
+        def read():
+            while True:
+                try:
+                    data = source.recv(65536)
+                except socket.error:
+                    data = b''
+                with ready:
+                    queue.append((time.time() + self.delay, data))
+                    ready.notify()
+                if not data:
+                    return
+
+        def write():
+            free_at = 0
+            while True:
+                with ready:
+                    while not queue:
+                        ready.wait()
+                    due, data = queue.popleft()
+                if not data:
+                    try:
+                        destination.shutdown(socket.SHUT_WR)
+                    except socket.error:
+                        pass
+                    return
+                send_at = max(due, free_at)
+                if self.bandwidth:
+                    free_at = send_at + float(len(data)) / self.bandwidth
+                wait = send_at - time.time()
+                if wait > 0:
+                    time.sleep(wait)
+                try:
+                    destination.sendall(data)
+                except socket.error:
+                    return
+        start_thread(read)
+        start_thread(write)
+
+    def close(self):
+        '''
+        Stops accepting connections
+
+        '''
+        close_listeners(self.listeners)
+
+
+class BenchmarkServer(object):
+    ''' Ssh/sftp server on a local port, optionally behind a :class:`ThrottledLink`
+
+    With *hosts* greater than 1, the server also listens on the same port of the following
+    loopback addresses (127.0.0.2, 127.0.0.3...), which stand for as many servers; their
+    addresses are in *hosts*. Loopback addresses other than 127.0.0.1 need Linux.
+
+    Arguments:
+        rtt (:obj:`float`): round trip time added to the connections, in seconds (default: 0)
+        bandwidth (:obj:`float`): bandwidth of each direction, in bytes per second (default:
+            None, unlimited)
+        hosts (:obj:`int`): number of loopback addresses served (default: 1)
+
+    '''
+    def __init__(self, rtt=0, bandwidth=None, hosts=1):
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.hosts = ['127.0.0.'+str(index + 1) for index in range(hosts)]
+        self.listeners = listen(['127.0.0.1'])
+        self.transports = []
+        self.link = None
+        self.port = self.listeners[0].getsockname()[1]
+        if rtt or bandwidth or hosts > 1:
+            self.link = ThrottledLink(self.port, rtt, bandwidth, self.hosts)
+            self.port = self.link.port
+        for listener in self.listeners:
+            start_thread(functools.partial(self.accept, listener))
+
+    def accept(self, listener):
+        '''Starts an ssh server transport for every accepted connection'''
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except socket.error:
+                return
+            start_thread(functools.partial(self.serve, sock))
+
+    def serve(self, sock):
+        '''Runs the ssh server side of an accepted connection'''
+        # like sshd, which disables Nagle's algorithm on its sessions
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        transport = paramiko.Transport(sock)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, StubSFTPServer)
+        try:
+            transport.start_server(server=StubServer())
+        except (paramiko.SSHException, EOFError, socket.error):
+            return
+        self.transports.append(transport)
+
+    def close(self):
+        '''
+        Stops the server and closes its connections
+
+        '''
+        close_listeners(self.listeners)
+        if self.link:
+            self.link.close()
+        for transport in self.transports:
+            transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def listen(addresses):
+    '''Opens listening sockets on the same free port of several local addresses
+
+    Arguments:
+        addresses (:obj:`list`): local addresses
+
+    Returns:
+        :obj:`list`: listening sockets, in the order of the addresses
+
+    '''
+    for _ in range(20):
+        listeners = []
+        try:
+            for address in addresses:
+                listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                listeners.append(listener)
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                listener.bind((address, listeners[0].getsockname()[1] if len(listeners) > 1
+                               else 0))
+                listener.listen(128)
+            return listeners
+        except socket.error:
+            # the port of the first address is taken in another one: try another port
+            for listener in listeners:
+                listener.close()
+    raise socket.error('No free port common to addresses '+', '.join(addresses))
+
+
+def close_listeners(listeners):
+    '''Closes listening sockets, waking up the threads blocked accepting on them'''
+    for listener in listeners:
+        # closing alone leaves a blocked accept running, and it may then take connections
+        # of a new listener that reuses the file descriptor
+        try:
+            listener.shutdown(socket.SHUT_RDWR)
+        except socket.error:
+            pass
+        listener.close()
+
+
+def start_thread(target):
+    '''Runs a function in a daemon thread'''
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    return thread
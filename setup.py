@@ -25,4 +25,9 @@ setup(
         "loggers >= 0.1",
         "paramiko >= 1.0",
     ],
+    entry_points={
+        'console_scripts': [
+            'ssh-paramiko = ssh_paramiko.cli:main',
+        ],
+    },
 )
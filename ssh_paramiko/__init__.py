@@ -1 +1,14 @@
+import sys
 from .ssh_paramiko import RemoteServer
+from .pool import RemoteServerPool
+from .fleet import FleetExecutor
+from .metrics import MetricsRegistry
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # asyncio is only imported by the programs using the asyncio front-end
+        if name == 'AsyncRemoteServer':
+            from .aio import AsyncRemoteServer
+            return AsyncRemoteServer
+        raise AttributeError('module '+__name__+' has no attribute '+name)
+elif sys.version_info >= (3, 5):
+    from .aio import AsyncRemoteServer
@@ -0,0 +1,289 @@
+#!/usr/bin/python
+import asyncio
+import functools
+import socket
+import time
+from shlex import quote
+from .hashing import REMOTE_HASH_COMMANDS, hash_local_file
+from .lazy import LazyModule
+from .netutils import REACHABILITY_CACHE, REACHABLE_TTL, UNREACHABLE_TTL
+from .ssh_paramiko import RemoteServer, to_str
+
+paramiko = LazyModule('paramiko')
+
+
+class AsyncRemoteServer(object):
+    ''' Asyncio front-end of :class:`RemoteServer`
+
+    Command output is read without blocking the event loop: the channel is watched by the
+    loop and drained only when data arrives, so a single process can drive thousands of
+    concurrent sessions. The ping check runs as an asyncio subprocess. The ssh handshake,
+    the channel opening and exec requests and the sftp file transfers are blocking in
+    paramiko, so they run in the loop default executor.
+
+    Arguments:
+        key_ssh(:obj:`str`): path of the ssh private key to connect (must be None if using
+            user and pasword to connect)
+        kwargs: keyword arguments of :class:`RemoteServer`
+
+    '''
+    def __init__(self, key_ssh, **kwargs):
+        self.remote_server = RemoteServer(key_ssh, **kwargs)
+
+    @property
+    def server(self):
+        '''Connected server, None if not connected'''
+        return self.remote_server.server
+
+    @property
+    def log(self):
+        '''Logger of the underlying :class:`RemoteServer`'''
+        return self.remote_server.log
+
+    async def connect_server(self, server, ping=True):
+        '''Connects a host and a server via ssh
+
+        Arguments:
+            server (:obj:`str`): remote server
+            ping (:obj:`bool`, *default* = True): if False, ignores if the remote server
+                does not ping back
+
+        Returns:
+            ret (:obj:`bool`): True if successfully connected, False otherwise
+        Returns:
+            msg (:obj:`str`): Message of error if cannot connect, empty string otherwise
+
+        '''
+        if ping and not await self.is_reachable(server):
+            self.log.error('Server '+str(server)+' is not reachable. Aborting connection.')
+            return False, 'Server is not reachable.'
+        return await self._run_blocking(self.remote_server.connect_server, server, False)
+
+    async def execute_cmd(self, cmd, timeout=20):
+        '''Executes a command in a remote server shell
+
+        Arguments:
+            cmd (:obj:`str`): command
+            timeout (:obj:`int`): seconds without any output after which the command is
+                abandoned (default: 20)
+
+        Returns:
+            ret (:obj:`bool`): True if command successfully executed, False otherwise
+        Returns:
+            output (:obj:`str`): command standard output
+        Returns:
+            error (:obj:`str`): command standard error
+
+        '''
+        if not await self.verify_server(timeout):
+            self.log.error('Can\'t verify if logged in the right server in order to issue the'
+                           ' command "'+cmd+'"')
+            return False, '', 'Can\'t verify if logged in the right server'
+        try:
+            output, error, exit_status = await self._run_channel(cmd, timeout)
+        except (paramiko.SSHException, socket.error, asyncio.TimeoutError) as ssh_error:
+            self.log.error('Can\'t perform the command due to a socket timeout error: '
+                           +str(ssh_error)+' _server: '+str(self.server))
+            return False, 'Socket Timeout', 'Socket Timeout'
+        if exit_status != 0:
+            self.log.error('Error while executing command "'+cmd+'" (exit status '
+                           +str(exit_status)+'): '+error)
+            return False, output, error
+        return True, output, error
+
+    async def verify_server(self, timeout=20):
+        '''Checks if the active transport is really logged in the expected server
+
+        See :meth:`RemoteServer.verify_server`; a lost connection is reconnected first, in a
+        worker thread.
+
+        Arguments:
+            timeout (:obj:`int`): timeout to the *hostname* command execution (default: 20)
+
+        Returns:
+            :obj:`bool`: *True* if logged in the right server, *False* otherwise
+
+        '''
+        if not self.remote_server.is_connected() and \
+           not await self._run_blocking(self.remote_server.ensure_connected):
+            return False
+        if self.remote_server.is_verified():
+            return True
+        try:
+            self.remote_server.count_verification('round_trips')
+            with self.remote_server.timed('hostname_check'):
+                output, error, _ = await self._run_channel('hostname', timeout)
+        except (paramiko.SSHException, socket.error, asyncio.TimeoutError,
+                AttributeError) as ssh_error:
+            self.log.error('Can\'t verify if logged in the right server due to a socket'
+                           ' error: '+str(ssh_error)+' Server: '+str(self.server))
+            return False
+        return self.remote_server.check_hostname(output, error)
+
+    async def put_file(self, local_file_path, remote_file_path, callback=None):
+        '''Transfers a local file to a remote file
+
+        See :meth:`RemoteServer.put_file`.
+
+        Returns:
+            :obj:`bool`: *True* if successfully transfered, *False* otherwise
+
+        '''
+        return await self._run_blocking(self.remote_server.put_file, local_file_path,
+                                        remote_file_path, callback)
+
+    async def get_file(self, local_file_path, remote_file_path, callback=None):
+        '''Transfers a remote file to a local file
+
+        See :meth:`RemoteServer.get_file`.
+
+        Returns:
+            :obj:`bool`: *True* if successfully transfered, *False* otherwise
+
+        '''
+        return await self._run_blocking(self.remote_server.get_file, local_file_path,
+                                        remote_file_path, callback)
+
+    async def validate_files(self, local_file_path, remote_file_path):
+        '''Checks if a remote and local files has the same checksum
+
+        The local file is hashed in the executor while the remote checksum command runs.
+
+        Arguments:
+            local_file_path (:obj:`str`): path of the local file to be validated
+            remote_file_path (:obj:`str`): path of the remote file to be validated
+
+        Returns:
+            :obj:`bool`: *True* if files' checksums are the same, *False* otherwise
+
+        '''
+        remote_server = self.remote_server
+        if not remote_server.server:
+            self.log.error('No connection with any server is active now.')
+            return False
+        start = time.time()
+        local_hash = asyncio.ensure_future(self._run_blocking(
+            hash_local_file, local_file_path, remote_server.hash_algorithm,
+            remote_server.hash_chunk_size))
+        command = REMOTE_HASH_COMMANDS.get(remote_server.hash_algorithm)
+        checksum_remote = None
+        if command:
+            ret, output, error = await self.execute_cmd(command+' '+quote(remote_file_path))
+            if ret:
+                checksum_remote = output.split(' ')[0]
+        if checksum_remote is None:
+            checksum_remote = await self._run_blocking(remote_server.remote_checksum,
+                                                       remote_file_path)
+        remote_hash_time = time.time() - start
+        return remote_server.compare_checksums(local_file_path, remote_file_path,
+                                               await local_hash, checksum_remote,
+                                               remote_hash_time=remote_hash_time)
+
+    async def close_connection(self):
+        '''Closes remote server connection
+
+        Returns:
+            :obj:`bool`: *True* if successfully disconnected, *False* otherwise
+
+        '''
+        return await self._run_blocking(self.remote_server.close_connection)
+
+    async def is_reachable(self, server):
+        '''Checks if a server is reachable, without blocking the event loop
+
+        See :meth:`RemoteServer.is_reachable`.
+
+        Arguments:
+            server (:obj:`str`): remote server
+
+        Returns:
+            :obj:`bool`: True if the server is reachable, False otherwise
+
+        '''
+        remote_server = self.remote_server
+        if remote_server.reachability == 'icmp':
+            return await self.ping_server(server)
+        key = (server, remote_server.ssh_port)
+        cached, reachable = REACHABILITY_CACHE.get(key)
+        if cached:
+            return reachable
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(server, remote_server.ssh_port),
+                remote_server.reachability_timeout)
+            writer.close()
+            reachable = True
+        except (socket.error, asyncio.TimeoutError):
+            reachable = False
+        REACHABILITY_CACHE.set(key, reachable, REACHABLE_TTL if reachable else UNREACHABLE_TTL)
+        return reachable
+
+    @staticmethod
+    async def ping_server(server, tries=4):
+        '''Checks if a server pings back, without blocking the event loop
+
+        Arguments:
+            server (:obj:`str`): remote server
+            tries (:obj:`int`): maximum number of ping rounds for each interval
+
+        Returns:
+            :obj:`bool`: True if the server pings back, False otherwise
+
+        '''
+        for interval in (0, 0.2):
+            for _ in range(1, tries):
+                ping = await asyncio.create_subprocess_exec(
+                    'ping', '-c', '2', '-i', str(interval), '-W', '1', server,
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+                output, _ = await ping.communicate()
+                if '2 packets transmitted, 2 received' in to_str(output):
+                    return True
+        return False
+
+    async def _run_channel(self, cmd, timeout):
+        '''Runs a command in a new channel, reading its output as the loop signals it
+
+        Returns:
+            :obj:`tuple`: command standard output, standard error and exit status
+
+        '''
+        remote_server = self.remote_server
+        with remote_server.timed('channel_open'):
+            chan = await self._run_blocking(remote_server.transport.open_session)
+        loop = asyncio.get_event_loop()
+        stdout, stderr = [], []
+        data_ready = asyncio.Event()
+        try:
+            # exec_command waits for the server reply to the request, a round trip
+            with remote_server.timed('exec'):
+                await self._run_blocking(chan.exec_command, cmd)
+            chan_fd = chan.fileno()
+            loop.add_reader(chan_fd, data_ready.set)
+            with remote_server.timed('read'):
+                try:
+                    while True:
+                        data_ready.clear()
+                        while chan.recv_ready():
+                            stdout.append(chan.recv(32768))
+                        while chan.recv_stderr_ready():
+                            stderr.append(chan.recv_stderr(32768))
+                        if (chan.exit_status_ready() or chan.closed) and not chan.recv_ready() \
+                           and not chan.recv_stderr_ready():
+                            break
+                        await asyncio.wait_for(data_ready.wait(), timeout)
+                finally:
+                    loop.remove_reader(chan_fd)
+            exit_status = chan.recv_exit_status()
+        finally:
+            chan.close()
+        remote_server.last_exit_status = exit_status
+        stdout, stderr = b''.join(stdout), b''.join(stderr)
+        remote_server.record_metric('ssh_paramiko_output_bytes', len(stdout), stream='stdout')
+        remote_server.record_metric('ssh_paramiko_output_bytes', len(stderr), stream='stderr')
+        return to_str(stdout), to_str(stderr), exit_status
+
+    @staticmethod
+    async def _run_blocking(function, *args):
+        '''Runs a blocking function in the loop default executor'''
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, functools.partial(function, *args))
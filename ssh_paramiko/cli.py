@@ -0,0 +1,241 @@
+#!/usr/bin/python
+''' ssh-paramiko command line: runs commands and copies files in many servers at once
+
+Usage::
+
+    $ ssh-paramiko -f hosts.txt -i ~/.ssh/id_ed25519 --parallel 64 exec 'uptime'
+    $ cat hosts.txt | ssh-paramiko put app.tgz /tmp/app.tgz then exec 'tar xzf /tmp/app.tgz'
+    $ ssh-paramiko -H web1 -H web2 get /etc/hostname 'out/{host}.hostname'
+
+Steps separated by *then* run in order in each server, over the same connection, and stop
+at the first failure. The words after *exec* form the command, options included
+(``exec ls -la /tmp``); commands with shell operators or the word *then* must be quoted.
+The result of each server is written to the standard output as one JSON line as soon as
+it finishes; logs go to the standard error.
+
+'''
+import argparse
+import json
+import logging
+import sys
+import time
+from .fleet import FleetExecutor
+from .pool import RemoteServerPool
+
+STEP_SEPARATOR = 'then'
+HOST_PLACEHOLDER = '{host}'
+
+
+def read_hosts(host_files, hosts):
+    '''Reads the list of servers
+
+    Host files have one or more servers per line, separated by spaces; lines starting with
+    # are ignored. If neither host files nor hosts are given, the standard input is read.
+
+    Arguments:
+        host_files (:obj:`list`): paths of host files (- is the standard input)
+        hosts (:obj:`list`): servers given in the command line
+
+    Returns:
+        :obj:`list`: servers, without duplicates, in the order they were given
+
+    '''
+    lines = []
+    if not host_files and not hosts:
+        host_files = ['-']
+    for host_file in host_files:
+        if host_file == '-':
+            lines.extend(sys.stdin)
+        else:
+            with open(host_file) as hosts_file:
+                lines.extend(hosts_file)
+    servers = []
+    for line in lines:
+        if not line.strip().startswith('#'):
+            servers.extend(line.split())
+    servers.extend(hosts)
+    seen = set()
+    return [server for server in servers if not (server in seen or seen.add(server))]
+
+
+def step_parser():
+    '''Parser of a single step (exec, put or get)'''
+    parser = argparse.ArgumentParser(prog='ssh-paramiko', add_help=False)
+    steps = parser.add_subparsers(dest='step')
+    exec_step = steps.add_parser('exec', help='execute a command', add_help=False)
+    # the words of the command up to the next step may look like options (ls -la)
+    exec_step.add_argument('command', nargs=argparse.REMAINDER,
+                           help='command and its arguments (words are joined by spaces)')
+    put_step = steps.add_parser('put', help='copy a local file to the servers')
+    put_step.add_argument('local', help='local file ('+HOST_PLACEHOLDER+' is replaced by '
+                          'the server name)')
+    put_step.add_argument('remote', help='remote file')
+    get_step = steps.add_parser('get', help='copy a remote file from the servers')
+    get_step.add_argument('remote', help='remote file')
+    get_step.add_argument('local', help='local file, must contain '+HOST_PLACEHOLDER
+                          +' if there are many servers')
+    return parser
+
+
+def parse_steps(words):
+    '''Parses the steps of the command line, separated by *then*
+
+    Arguments:
+        words (:obj:`list`): command line words after the options
+
+    Returns:
+        :obj:`list`: parsed steps (:obj:`argparse.Namespace`)
+
+    '''
+    steps = [[]]
+    for word in words:
+        if word == STEP_SEPARATOR:
+            steps.append([])
+        else:
+            steps[-1].append(word)
+    parser = step_parser()
+    parsed = []
+    for step in steps:
+        if not step:
+            parser.error('empty step: expected exec, put or get')
+        parsed.append(parser.parse_args(step))
+        if parsed[-1].step == 'exec' and not parsed[-1].command:
+            parser.error('exec needs a command')
+    return parsed
+
+
+def run_step(remote_server, step, timeout):
+    '''Runs a step in a connected server
+
+    Arguments:
+        remote_server (:obj:`RemoteServer`): connected server
+        step (:obj:`argparse.Namespace`): parsed step
+        timeout (:obj:`int`): command timeout, in seconds
+
+    Returns:
+        :obj:`dict`: step result, with *ok* True if the step succeeded
+
+    '''
+    server = remote_server.server
+    result = {'step': step.step}
+    start = time.time()
+    try:
+        if step.step == 'exec':
+            result['command'] = ' '.join(step.command)
+            ret, output, error, exit_status = remote_server.execute_cmd(
+                result['command'], timeout, with_status=True)
+            result.update({'ok': ret, 'exit_status': exit_status, 'stdout': output,
+                           'stderr': error})
+        else:
+            result['local'] = step.local.replace(HOST_PLACEHOLDER, server)
+            result['remote'] = step.remote.replace(HOST_PLACEHOLDER, server)
+            transfer = remote_server.put_file if step.step == 'put' else remote_server.get_file
+            result['ok'] = transfer(result['local'], result['remote'])
+    except Exception as error:
+        result.update({'ok': False, 'error': str(error)})
+    result['seconds'] = time.time() - start
+    return result
+
+
+def run_steps(remote_server, steps, timeout):
+    '''Runs the steps in a connected server, stopping at the first failed one
+
+    Returns:
+        :obj:`tuple`: *True* if all the steps succeeded, list of step results and an empty
+        error message
+
+    '''
+    results = []
+    for step in steps:
+        results.append(run_step(remote_server, step, timeout))
+        if not results[-1]['ok']:
+            break
+    return all(result['ok'] for result in results), results, ''
+
+
+def main(argv=None):
+    '''Entry point of the ssh-paramiko command
+
+    Arguments:
+        argv (:obj:`list`): command line arguments (default: sys.argv[1:])
+
+    Returns:
+        :obj:`int`: exit status: 0 if all the servers succeeded, 1 otherwise
+
+    '''
+    parser = argparse.ArgumentParser(
+        prog='ssh-paramiko',
+        description='Runs commands and copies files in many servers at once.',
+        epilog='steps: exec COMMAND | put LOCAL REMOTE | get REMOTE LOCAL, separated by '
+               '"'+STEP_SEPARATOR+'"')
+    parser.add_argument('-f', '--hosts', action='append', default=[], metavar='FILE',
+                        help='file with the servers, - for the standard input (default: '
+                             'standard input, if no -H is given)')
+    parser.add_argument('-H', '--host', action='append', default=[], dest='host_names',
+                        metavar='HOST', help='server (can be repeated)')
+    parser.add_argument('-i', '--identity', default=None, metavar='KEY',
+                        help='private key file')
+    parser.add_argument('-A', '--agent', action='store_true', help='use the ssh agent keys')
+    parser.add_argument('-u', '--user', default='root', help='user (default: root)')
+    parser.add_argument('-p', '--port', type=int, default=22, help='ssh port (default: 22)')
+    parser.add_argument('--parallel', type=int, default=32, metavar='N',
+                        help='servers handled at the same time (default: 32)')
+    parser.add_argument('--timeout', type=int, default=60,
+                        help='seconds allowed to each server (default: 60)')
+    parser.add_argument('--no-ping', action='store_true',
+                        help='connect even if the server does not seem reachable')
+    parser.add_argument('--no-hostname-check', action='store_true',
+                        help='do not check that the remote hostname is the server name')
+    parser.add_argument('--known-hosts', default=None, metavar='FILE',
+                        help='known hosts file (default: host keys kept in memory)')
+    parser.add_argument('--strict-host-keys', action='store_true',
+                        help='reject servers whose host key is not known')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log debug messages')
+    parser.add_argument('steps', nargs=argparse.REMAINDER, help='steps to run')
+    args = parser.parse_args(argv)
+    if not args.steps:
+        parser.error('no step given')
+    steps = parse_steps(args.steps)
+    servers = read_hosts(args.hosts, args.host_names)
+    if not servers:
+        parser.error('no server given')
+    if len(servers) > 1 and any(step.step == 'get' and HOST_PLACEHOLDER not in step.local
+                                for step in steps):
+        parser.error('get needs '+HOST_PLACEHOLDER+' in the local file with many servers')
+    # the library loggers write to the standard output unless they already have a handler
+    handler = logging.StreamHandler(sys.stderr)
+    for name in ('ssh_paramiko', 'ssh_paramiko_pool', 'ssh_paramiko_fleet'):
+        log = logging.getLogger(name)
+        log.addHandler(handler)
+        if args.verbose:
+            log.setLevel(logging.DEBUG)
+    server_args = {
+        'username': args.user,
+        'ssh_port': args.port,
+        'use_agent': args.agent,
+        'server_has_dns': not args.no_hostname_check,
+        'known_hosts': args.known_hosts,
+        'reject_unknown_hosts': args.strict_host_keys
+        }
+    failed = 0
+    with RemoteServerPool(max_size=max(len(servers), 1), idle_timeout=None,
+                          server_args=server_args) as pool:
+        fleet = FleetExecutor(args.identity, max_workers=args.parallel,
+                              host_timeout=args.timeout, ping=not args.no_ping, pool=pool,
+                              server_args=server_args)
+
+        def operation(remote_server):
+            return run_steps(remote_server, steps, args.timeout)
+        for server, (ret, results, error) in fleet.run(servers, operation):
+            line = {'host': server, 'ok': ret,
+                    'steps': results if isinstance(results, list) else []}
+            if error:
+                line['error'] = error
+            failed += not ret
+            sys.stdout.write(json.dumps(line, sort_keys=True)+'\n')
+            sys.stdout.flush()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+#!/usr/bin/python
+import threading
+import time
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+from loggers import Loggers
+from .netutils import probe_servers, resolve_all
+from .ssh_paramiko import RemoteServer
+
+
+class FleetExecutor(Loggers):
+    ''' Runs the same operation against many servers in parallel
+
+    Each server is connected, handled and (unless a pool is used) disconnected by one of a
+    bounded set of worker threads. Results are yielded as soon as each server finishes, so
+    one slow server does not hold back the others; a server that takes longer than
+    *host_timeout* is reported as failed, its connection is closed (and removed from the
+    pool) to interrupt the operation, and its worker is replaced: the abandoned worker exits
+    as soon as that server returns, so no more than *max_workers* servers are handled at
+    the same time.
+
+    Arguments:
+        key_ssh(:obj:`str`): path of the ssh private key to connect (must be None if using
+            user and pasword to connect)
+        max_workers(:obj:`int`, optional, *default* =32): maximum number of servers handled
+            at the same time
+        host_timeout(:obj:`int`, optional, *default* =60): seconds allowed to each server
+            for connecting and running the operation
+        ping(:obj:`bool`, optional, *default* =True): if False, ignores if the remote server
+            does not ping back
+        pool(:obj:`RemoteServerPool`, optional, *default* =None): pool from which the
+            connections are taken; if None, each connection is closed after its operation
+        log_folder(:obj:`str`, optional, *default* =None): folder where the log files of
+            this class will be generated
+        server_args(:obj:`dict`, optional, *default* ={}): keyword arguments of the
+            :class:`RemoteServer` instances
+
+    '''
+    def __init__(self, key_ssh, **kwargs):
+        opt_args = {
+            'max_workers': 32,
+            'host_timeout': 60,
+            'ping': True,
+            'pool': None,
+            'log_folder': None,
+            'server_args': {}
+            }
+        opt_args.update(kwargs)
+        if not opt_args['log_folder']:
+            super(FleetExecutor, self).__init__('ssh_paramiko_fleet')
+        else:
+            super(FleetExecutor, self).__init__('ssh_paramiko_fleet',
+                                                log_folder_path=opt_args['log_folder'])
+        self.key_ssh = key_ssh
+        self.max_workers = opt_args['max_workers']
+        self.host_timeout = opt_args['host_timeout']
+        self.ping = opt_args['ping']
+        self.pool = opt_args['pool']
+        self.server_args = opt_args['server_args']
+
+    def execute_cmd(self, servers, cmd):
+        '''Executes a command in many remote servers
+
+        Arguments:
+            servers (:obj:`list`): remote servers
+            cmd (:obj:`str`): command
+
+        Returns:
+            :obj:`generator`: pairs of server and its :meth:`RemoteServer.execute_cmd`
+            result (ret, output, error), in completion order
+
+        '''
+        return self.run(servers, lambda remote_server: remote_server.execute_cmd(
+            cmd, self.host_timeout))
+
+    def run(self, servers, operation):
+        '''Runs an operation in many remote servers
+
+        Arguments:
+            servers (:obj:`list`): remote servers
+            operation (:obj:`callable`): called with each connected :class:`RemoteServer`;
+                must return a (ret, output, error) tuple
+
+        Returns:
+            :obj:`generator`: pairs of server and its operation result, in completion order
+
+        '''
+        tasks = Queue()
+        results = Queue()
+        started = {}
+        connections = {}
+        timed_out = set()
+        lock = threading.Lock()
+        pending = set()
+        for server in servers:
+            if server not in pending:
+                pending.add(server)
+                tasks.put(server)
+
+        def worker():
+            while True:
+                try:
+                    server = tasks.get_nowait()
+                except Empty:
+                    return
+                started[server] = time.time()
+                result = self.run_server(server, operation, connections)
+                with lock:
+                    remote_server = connections.pop(server, None)
+                    abandoned = server in timed_out
+                if abandoned:
+                    # another worker already took the place of this one
+                    if remote_server:
+                        self.close_abandoned(remote_server)
+                    return
+                results.put((server, result))
+
+        def start_worker():
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+
+        # resolve (and probe) every server at once, so the workers find the results cached
+        port = self.server_args.get('ssh_port', 22)
+        resolve_all(list(pending), port, self.max_workers)
+        if self.ping and self.server_args.get('reachability', 'tcp') == 'tcp':
+            probe_servers(list(pending), port,
+                          self.server_args.get('reachability_timeout', 1.0))
+        for _ in range(min(self.max_workers, len(pending))):
+            start_worker()
+        while pending:
+            try:
+                server, result = results.get(timeout=0.5)
+            except Empty:
+                server = None
+            if server in pending:
+                pending.discard(server)
+                yield server, result
+            now = time.time()
+            for server, start in list(started.items()):
+                if server in pending and now - start > self.host_timeout:
+                    self.log.error('Server '+str(server)+' timed out after '
+                                   +str(self.host_timeout)+' seconds')
+                    pending.discard(server)
+                    with lock:
+                        timed_out.add(server)
+                        remote_server = connections.get(server)
+                    if remote_server:
+                        self.close_abandoned(remote_server)
+                    # the stuck worker is abandoned: start another one in its place
+                    start_worker()
+                    yield server, (False, '', 'Timeout')
+
+    def run_server(self, server, operation, connections=None):
+        '''Connects a server and runs an operation on it
+
+        Arguments:
+            server (:obj:`str`): remote server
+            operation (:obj:`callable`): called with the connected :class:`RemoteServer`
+            connections (:obj:`dict`, optional): the connection is recorded in it by server
+                while the operation runs, so it can be closed if the server times out
+
+        Returns:
+            :obj:`tuple`: operation result, or (False, '', error message) if cannot connect
+
+        '''
+        try:
+            if self.pool is not None:
+                remote_server, msg = self.pool.get_server(server, self.key_ssh, self.ping,
+                                                          **self.server_args)
+            else:
+                remote_server = RemoteServer(self.key_ssh, **self.server_args)
+                ret, msg = remote_server.connect_server(server, self.ping)
+                if not ret:
+                    remote_server = None
+            if not remote_server:
+                return False, '', msg
+            if connections is not None:
+                connections[server] = remote_server
+            try:
+                return operation(remote_server)
+            finally:
+                if self.pool is None:
+                    remote_server.close_connection()
+        except Exception as error:
+            self.log.error('Error while running operation in server '+str(server)+': '
+                           +str(error))
+            return False, '', str(error)
+
+    def close_abandoned(self, remote_server):
+        '''Closes the connection of a server that timed out, removing it from the pool
+
+        Arguments:
+            remote_server (:obj:`RemoteServer`): connection of the server
+
+        '''
+        try:
+            if self.pool is not None:
+                self.pool.discard(remote_server)
+            else:
+                remote_server.drop_connection()
+        except Exception as error:
+            self.log.warning('Error while closing connection with server '
+                             +str(remote_server.server)+': '+str(error))
@@ -0,0 +1,150 @@
+#!/usr/bin/python
+import hashlib
+import mmap
+import os
+import time
+import zlib
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+CHUNK_SIZE = 1048576
+
+# commands that print the checksum of a file in the remote server, for each algorithm
+REMOTE_HASH_COMMANDS = {
+    'md5': 'md5sum',
+    'sha1': 'sha1sum',
+    'sha256': 'sha256sum',
+    'sha512': 'sha512sum',
+    'blake2b': 'b2sum',
+    'xxh64': 'xxhsum -H1',
+    }
+
+
+def new_hash(algorithm='sha1'):
+    '''Creates a hash object
+
+    Arguments:
+        algorithm (:obj:`str`): hashlib algorithm name, or *xxh64* if the xxhash module is
+            available
+
+    Returns:
+        hash object with *update* and *hexdigest* methods
+
+    '''
+    if algorithm == 'xxh64':
+        if xxhash is None:
+            raise ValueError('The xxhash module is required by the xxh64 algorithm')
+        return xxhash.xxh64()
+    return hashlib.new(algorithm)
+
+
+def hash_bytes(data, algorithm='sha1'):
+    '''Computes the checksum of a block of data
+
+    Arguments:
+        data (:obj:`bytes`): data to be hashed
+        algorithm (:obj:`str`): hash algorithm (default: sha1)
+
+    Returns:
+        :obj:`str`: hexadecimal checksum
+
+    '''
+    digest = new_hash(algorithm)
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def compression_ratio(data):
+    '''Estimates how well some data compresses with zlib, as used by ssh compression
+
+    Arguments:
+        data (:obj:`bytes`): data sample
+
+    Returns:
+        :obj:`float`: original size divided by compressed size
+
+    '''
+    return float(len(data)) / len(zlib.compress(data, 6))
+
+
+def hash_local_file(file_path, algorithm='sha1', chunk_size=CHUNK_SIZE):
+    '''Computes the checksum of a local file, reading it in fixed-size chunks of a mmap
+
+    Arguments:
+        file_path (:obj:`str`): path of the local file
+        algorithm (:obj:`str`): hash algorithm (default: sha1)
+        chunk_size (:obj:`int`): size of each chunk fed to the hash
+
+    Returns:
+        :obj:`str`: hexadecimal checksum
+
+    '''
+    digest = new_hash(algorithm)
+    with open(file_path, 'rb') as local_file:
+        size = os.fstat(local_file.fileno()).st_size
+        if size:
+            mapped = mmap.mmap(local_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for offset in range(0, size, chunk_size):
+                    digest.update(mapped[offset:offset + chunk_size])
+            finally:
+                mapped.close()
+    return digest.hexdigest()
+
+
+def hash_file_object(file_obj, algorithm='sha1', chunk_size=CHUNK_SIZE):
+    '''Computes the checksum of an open file object, reading it in fixed-size chunks
+
+    Arguments:
+        file_obj: object with a *read* method
+        algorithm (:obj:`str`): hash algorithm (default: sha1)
+        chunk_size (:obj:`int`): size of each chunk fed to the hash
+
+    Returns:
+        :obj:`str`: hexadecimal checksum
+
+    '''
+    digest = new_hash(algorithm)
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HashingFile(object):
+    ''' File wrapper that hashes the data read from or written to it
+
+    The seconds spent hashing are accumulated in *hash_time*.
+
+    Arguments:
+        file_obj: wrapped file object
+        algorithm (:obj:`str`): hash algorithm (default: sha1)
+
+    '''
+    def __init__(self, file_obj, algorithm='sha1'):
+        self.file_obj = file_obj
+        self.digest = new_hash(algorithm)
+        self.hash_time = 0
+
+    def read(self, size=-1):
+        '''Reads from the wrapped file, hashing the data read'''
+        data = self.file_obj.read(size)
+        start = time.time()
+        self.digest.update(data)
+        self.hash_time += time.time() - start
+        return data
+
+    def write(self, data):
+        '''Writes to the wrapped file, hashing the data written'''
+        start = time.time()
+        self.digest.update(data)
+        self.hash_time += time.time() - start
+        return self.file_obj.write(data)
+
+    def hexdigest(self):
+        '''Checksum of the data read or written so far'''
+        return self.digest.hexdigest()
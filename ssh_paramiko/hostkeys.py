@@ -0,0 +1,258 @@
+#!/usr/bin/python
+import atexit
+import base64
+import hmac
+import os
+import threading
+from hashlib import sha1
+from .lazy import LazyModule
+
+paramiko = LazyModule('paramiko')
+
+HASH_MAGIC = '|1|'
+
+
+def host_key_name(server, port=22):
+    '''Name of a server in a known hosts file, as used by OpenSSH
+
+    Arguments:
+        server (:obj:`str`): remote server
+        port (:obj:`int`): ssh tcp port (default: 22)
+
+    Returns:
+        :obj:`str`: server name, in brackets and followed by the port if it is not 22
+
+    '''
+    return server if port == 22 else '['+server+']:'+str(port)
+
+
+class KnownHostsStore(object):
+    ''' Thread-safe known hosts store indexed by host name
+
+    The known hosts file is read once, the first time a key is looked up, into a dict
+    from host name to keys by type. Hashed host names can't be indexed, so the first lookup
+    of a name not found in the dict checks it against the hashed entries, and its result is
+    kept in the dict. New keys are appended to the file in batches of *batch_size* (and when
+    the process exits), instead of rewriting the file for every new host.
+
+    Arguments:
+        file_path (:obj:`str`, optional, *default* =None): known hosts file (None keeps the
+            keys in memory only)
+        hash_hostnames (:obj:`bool`, optional, *default* =False): if True, new host names
+            are written hashed
+        batch_size (:obj:`int`, optional, *default* =100): number of new keys written to the
+            file at once
+
+    '''
+    def __init__(self, file_path=None, hash_hostnames=False, batch_size=100):
+        self.file_path = os.path.expanduser(file_path) if file_path else None
+        self.hash_hostnames = hash_hostnames
+        self.batch_size = batch_size
+        self.hosts = {}
+        self.hashed_entries = []
+        self.pending = []
+        self.loaded = False
+        self.lock = threading.RLock()
+        if self.file_path:
+            atexit.register(self.flush)
+
+    def load(self):
+        '''
+        Reads the known hosts file, if not read yet
+
+        '''
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            if not self.file_path or not os.path.isfile(self.file_path):
+                return
+            with open(self.file_path) as known_hosts:
+                for line in known_hosts:
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    try:
+                        entry = paramiko.hostkeys.HostKeyEntry.from_line(line)
+                    except (paramiko.SSHException, ValueError):
+                        continue
+                    if entry is None:
+                        continue
+                    for hostname in entry.hostnames:
+                        self._index(hostname, entry.key)
+
+    def _index(self, hostname, key):
+        '''Adds a key of a plain or hashed host name to the in-memory index'''
+        if hostname.startswith(HASH_MAGIC):
+            try:
+                salt, digest = [base64.b64decode(field)
+                                for field in hostname[len(HASH_MAGIC):].split('|')]
+            except (TypeError, ValueError):
+                return
+            self.hashed_entries.append((salt, digest, key))
+        else:
+            self.hosts.setdefault(hostname, {})[key.get_name()] = key
+
+    def lookup(self, hostname):
+        '''Known keys of a host
+
+        Arguments:
+            hostname (:obj:`str`): host name, as given by :func:`host_key_name`
+
+        Returns:
+            :obj:`dict`: keys by key type (empty if the host is unknown)
+
+        '''
+        self.load()
+        with self.lock:
+            keys = self.hosts.get(hostname)
+            if keys is None:
+                keys = {}
+                encoded = hostname.encode('utf-8')
+                for salt, digest, key in self.hashed_entries:
+                    if hmac.new(salt, encoded, sha1).digest() == digest:
+                        keys[key.get_name()] = key
+                self.hosts[hostname] = keys
+            return keys
+
+    def check(self, hostname, key):
+        '''Checks a host key against the known keys of the host
+
+        Arguments:
+            hostname (:obj:`str`): host name, as given by :func:`host_key_name`
+            key (:obj:`paramiko.PKey`): key presented by the host
+
+        Returns:
+            :obj:`bool`: *True* if the key is known, *False* if the host has a different key
+            of the same type, None if no key of that type is known
+
+        '''
+        known_key = self.lookup(hostname).get(key.get_name())
+        if known_key is None:
+            return None
+        return known_key.asbytes() == key.asbytes()
+
+    def add(self, hostname, key):
+        '''Adds a host key, writing it to the file with the next batch
+
+        Arguments:
+            hostname (:obj:`str`): host name, as given by :func:`host_key_name`
+            key (:obj:`paramiko.PKey`): host key
+
+        '''
+        with self.lock:
+            self.lookup(hostname)[key.get_name()] = key
+            if self.file_path:
+                name = paramiko.HostKeys.hash_host(hostname) if self.hash_hostnames \
+                    else hostname
+                self.pending.append(paramiko.hostkeys.HostKeyEntry([name], key).to_line())
+                if len(self.pending) >= self.batch_size:
+                    self.flush()
+
+    def flush(self):
+        '''
+        Appends the keys added since the last write to the known hosts file
+
+        '''
+        with self.lock:
+            if not self.pending or not self.file_path:
+                return
+            descriptor = os.open(self.file_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                                 0o600)
+            with os.fdopen(descriptor, 'a') as known_hosts:
+                known_hosts.writelines(self.pending)
+            self.pending = []
+
+
+class KnownHostsPolicy(object):
+    ''' Host key policy (see :obj:`paramiko.MissingHostKeyPolicy`) checking the keys of a
+    :class:`KnownHostsStore`
+
+    Keys of unknown hosts are accepted for the connection being made (trust on first use),
+    unless *reject_unknown* is set, but they are only added to the store by :meth:`confirm`,
+    once the identity of the server has been verified; :meth:`discard` forgets them if it
+    could not be. Keys different from the known ones are always rejected. The name of the
+    last host whose key was already in the store is kept in *last_match*.
+
+    Arguments:
+        store (:obj:`KnownHostsStore`): known hosts store
+        reject_unknown (:obj:`bool`, optional, *default* =False): if True, hosts not in the
+            store are rejected
+
+    '''
+    def __init__(self, store, reject_unknown=False):
+        self.store = store
+        self.reject_unknown = reject_unknown
+        self.last_match = None
+        self.pending = None
+
+    def missing_host_key(self, client, hostname, key):
+        '''Called by paramiko for every host key not in the client own host keys'''
+        self.verify(hostname, key)
+
+    def verify(self, hostname, key):
+        '''Checks a host key, keeping it as pending confirmation if it is unknown and accepted
+
+        Arguments:
+            hostname (:obj:`str`): host name, as given by :func:`host_key_name`
+            key (:obj:`paramiko.PKey`): key presented by the host
+
+        Returns:
+            :obj:`bool`: *True* if the key was already known, *False* if it is pending
+
+        Raises:
+            :obj:`paramiko.BadHostKeyException`: if the host has a different known key
+            :obj:`paramiko.SSHException`: if the host is unknown and *reject_unknown* is set
+
+        '''
+        known = self.store.check(hostname, key)
+        if known:
+            self.last_match = hostname
+            return True
+        self.last_match = None
+        if known is False:
+            raise paramiko.BadHostKeyException(hostname, key,
+                                               self.store.lookup(hostname)[key.get_name()])
+        if self.reject_unknown:
+            raise paramiko.SSHException('Server '+hostname+' not found in known hosts')
+        self.pending = (hostname, key)
+        return False
+
+    def confirm(self):
+        '''
+        Adds the pending key, if any, to the store, once the server identity is verified
+
+        '''
+        if self.pending:
+            self.store.add(*self.pending)
+        self.pending = None
+
+    def discard(self):
+        '''
+        Forgets the pending key, if any, of a server whose identity could not be verified
+
+        '''
+        self.pending = None
+
+
+# known hosts stores shared by the whole process, by file path (None for the in-memory one)
+STORES = {}
+STORES_LOCK = threading.Lock()
+
+
+def get_known_hosts(file_path=None):
+    '''Returns the process-wide store of a known hosts file, creating it on first use
+
+    Arguments:
+        file_path (:obj:`str`): known hosts file (default: None, keys in memory only)
+
+    Returns:
+        :obj:`KnownHostsStore`: shared store
+
+    '''
+    file_path = os.path.abspath(os.path.expanduser(file_path)) if file_path else None
+    with STORES_LOCK:
+        store = STORES.get(file_path)
+        if store is None:
+            store = STORES[file_path] = KnownHostsStore(file_path)
+        return store
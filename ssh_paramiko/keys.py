@@ -0,0 +1,112 @@
+#!/usr/bin/python
+import hashlib
+import os
+import threading
+from .lazy import LazyModule
+
+paramiko = LazyModule('paramiko')
+
+# private key classes tried, in order, when paramiko can't detect the type of a key file
+KEY_CLASSES = ('Ed25519Key', 'ECDSAKey', 'RSAKey', 'DSSKey')
+
+# private keys already loaded by the process, by path, modification time, size and digest
+# of the passphrase
+KEY_CACHE = {}
+KEY_CACHE_LOCK = threading.Lock()
+
+
+def load_private_key(key_path, password=None):
+    '''Loads a private key file of any type, parsing each file only once per process
+
+    The key is cached by its absolute path, modification time and size, so a replaced key
+    file is loaded again, while instantiating many :class:`RemoteServer` with the same key
+    only parses (and decrypts) it once. The passphrase is part of the cache key as well (as
+    a digest), so a key decrypted once is not handed out without its passphrase.
+
+    Arguments:
+        key_path (:obj:`str`): path of the private key file
+        password (:obj:`str`): passphrase of an encrypted key (default: None)
+
+    Returns:
+        :obj:`paramiko.PKey`: Ed25519, ECDSA, RSA or DSS private key
+
+    Raises:
+        :obj:`paramiko.PasswordRequiredException`: if the key is encrypted and no
+            passphrase is given
+        :obj:`paramiko.SSHException`: if the file is not a supported private key
+        :obj:`IOError`: if the file can't be read
+
+    '''
+    key_path = os.path.abspath(os.path.expanduser(key_path))
+    key_stat = os.stat(key_path)
+    cache_key = (key_path, key_stat.st_mtime, key_stat.st_size, password_digest(password))
+    with KEY_CACHE_LOCK:
+        private_key = KEY_CACHE.get(cache_key)
+    if private_key is not None:
+        return private_key
+    private_key = read_private_key(key_path, password)
+    with KEY_CACHE_LOCK:
+        # keys loaded from a previous version of the file are dropped
+        for cached in [cached for cached in KEY_CACHE
+                       if cached[0] == key_path and cached[1:3] != cache_key[1:3]]:
+            del KEY_CACHE[cached]
+        KEY_CACHE[cache_key] = private_key
+    return private_key
+
+
+def password_digest(password):
+    '''Digest of a passphrase identifying it in the key cache (None if there is none)'''
+    if password is None:
+        return None
+    if not isinstance(password, bytes):
+        password = password.encode('utf-8')
+    return hashlib.sha256(password).hexdigest()
+
+
+def read_private_key(key_path, password=None):
+    '''Parses a private key file, detecting its type
+
+    Arguments:
+        key_path (:obj:`str`): path of the private key file
+        password (:obj:`str`): passphrase of an encrypted key (default: None)
+
+    Returns:
+        :obj:`paramiko.PKey`: private key
+
+    '''
+    if hasattr(paramiko.PKey, 'from_path'):
+        if password is not None and not isinstance(password, bytes):
+            password = password.encode('utf-8')
+        return paramiko.PKey.from_path(key_path, password)
+    for key_class in [getattr(paramiko, name) for name in KEY_CLASSES
+                      if hasattr(paramiko, name)]:
+        try:
+            return key_class.from_private_key_file(key_path, password)
+        except paramiko.PasswordRequiredException:
+            raise
+        except (paramiko.SSHException, ValueError):
+            continue
+    raise paramiko.SSHException('Unsupported private key file: '+key_path)
+
+
+def clear_key_cache():
+    '''
+    Forgets the private keys loaded so far
+
+    '''
+    with KEY_CACHE_LOCK:
+        KEY_CACHE.clear()
+
+
+def agent_keys():
+    '''Keys offered by the running ssh agent
+
+    Returns:
+        :obj:`list`: :obj:`paramiko.AgentKey` objects, empty if no agent is available
+
+    '''
+    agent = paramiko.Agent()
+    keys = list(agent.get_keys())
+    if not keys:
+        agent.close()
+    return keys
@@ -0,0 +1,24 @@
+#!/usr/bin/python
+import importlib
+
+
+class LazyModule(object):
+    ''' Module proxy that imports the module the first time one of its attributes is used
+
+    paramiko and its crypto backends take a large part of the start up time of short-lived
+    programs, so they are only imported when a connection is really made.
+
+    Arguments:
+        name (:obj:`str`): module name
+
+    '''
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attribute):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return getattr(module, attribute)
@@ -0,0 +1,164 @@
+#!/usr/bin/python
+import bisect
+import os
+import threading
+
+# upper bounds of the histogram buckets of durations (seconds) and sizes (bytes)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                    10.0, 30.0, 60.0, 300.0)
+SIZE_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(12))
+
+
+class Histogram(object):
+    ''' Cumulative histogram of observed values
+
+    Arguments:
+        buckets (:obj:`tuple`): sorted upper bounds of the buckets
+
+    '''
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = None
+
+    def observe(self, value):
+        '''Adds a value to the histogram'''
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def cumulative_counts(self):
+        '''Number of observed values up to each bucket bound, as (bound, count) pairs'''
+        total = 0
+        counts = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            counts.append((bound, total))
+        return counts
+
+
+class MetricsRegistry(object):
+    ''' Thread-safe in-memory metrics hook
+
+    An instance can be given as the *metrics* argument of :class:`RemoteServer`: every
+    observation is added to a histogram per metric name and set of labels. Metrics whose
+    name ends with *_bytes* use SIZE_BUCKETS, any other DURATION_BUCKETS.
+
+    '''
+    def __init__(self):
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, name, value, labels):
+        '''Records an observation
+
+        Arguments:
+            name (:obj:`str`): metric name
+            value (:obj:`float`): observed value
+            labels (:obj:`dict`): labels of the observation
+
+        '''
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(SIZE_BUCKETS if name.endswith('_bytes')
+                                      else DURATION_BUCKETS)
+                self.histograms[key] = histogram
+            histogram.observe(value)
+
+    def snapshot(self):
+        '''Summary of the recorded metrics
+
+        Returns:
+            :obj:`list`: dicts with the *name*, *labels*, *count*, *sum*, *mean* and *max* of
+            each histogram, sorted by name and labels
+
+        '''
+        with self.lock:
+            return [{'name': name, 'labels': dict(labels), 'count': histogram.count,
+                     'sum': histogram.sum, 'mean': float(histogram.sum) / histogram.count,
+                     'max': histogram.max}
+                    for (name, labels), histogram in sorted(self.histograms.items())]
+
+    def slowest(self, name='ssh_paramiko_phase_seconds', count=10, **labels):
+        '''Histograms of a metric with the highest mean, such as the slowest hosts of a phase
+
+        Arguments:
+            name (:obj:`str`): metric name (default: ssh_paramiko_phase_seconds)
+            count (:obj:`int`): maximum number of results (default: 10)
+            labels: labels the histograms must have, such as *phase*
+
+        Returns:
+            :obj:`list`: summaries as returned by :meth:`snapshot`
+
+        '''
+        matches = [summary for summary in self.snapshot() if summary['name'] == name and
+                   all(summary['labels'].get(label) == value
+                       for label, value in labels.items())]
+        return sorted(matches, key=lambda summary: summary['mean'], reverse=True)[:count]
+
+    def prometheus_text(self):
+        '''Renders the recorded metrics in the Prometheus text exposition format
+
+        Returns:
+            :obj:`str`: histograms in the Prometheus text format
+
+        '''
+        lines = []
+        described = set()
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in described:
+                    lines.append('# TYPE '+name+' histogram')
+                    described.add(name)
+                for bound, count in histogram.cumulative_counts():
+                    bucket_labels = labels + (('le', format_bound(bound)),)
+                    lines.append(name+'_bucket'+format_labels(bucket_labels)+' '+str(count))
+                lines.append(name+'_sum'+format_labels(labels)+' '+repr(float(histogram.sum)))
+                lines.append(name+'_count'+format_labels(labels)+' '+str(histogram.count))
+        return '\n'.join(lines)+'\n'
+
+    def write_textfile(self, file_path):
+        '''Writes the metrics in the Prometheus text format, replacing the file atomically
+
+        Meant for the textfile collector of the Prometheus node exporter.
+
+        Arguments:
+            file_path (:obj:`str`): path of the metrics file
+
+        '''
+        temp_path = file_path+'.'+str(os.getpid())+'.tmp'
+        try:
+            with open(temp_path, 'w') as temp_file:
+                temp_file.write(self.prometheus_text())
+            os.rename(temp_path, file_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def clear(self):
+        '''
+        Removes all the recorded metrics
+
+        '''
+        with self.lock:
+            self.histograms.clear()
+
+
+def format_bound(bound):
+    '''Formats a bucket bound as a Prometheus *le* label value'''
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def format_labels(labels):
+    '''Formats (name, value) label pairs as a Prometheus label set'''
+    if not labels:
+        return ''
+    return '{'+','.join(name+'="'+str(value).replace('\\', '\\\\').replace('"', '\\"')
+                        .replace('\n', '\\n')+'"' for name, value in labels)+'}'
@@ -0,0 +1,236 @@
+#!/usr/bin/python
+import errno
+import select
+import socket
+import threading
+import time
+
+
+class TTLCache(object):
+    ''' Thread-safe cache whose entries expire after a time to live
+
+    '''
+    def __init__(self):
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        '''Returns a cached value
+
+        Arguments:
+            key: cache key
+
+        Returns:
+            :obj:`tuple`: *True* and the value if the key is cached and not expired,
+            *False* and None otherwise
+
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[1] < time.time():
+                del self.entries[key]
+                return False, None
+            return True, entry[0]
+
+    def set(self, key, value, ttl):
+        '''Caches a value
+
+        Arguments:
+            key: cache key
+            value: cached value
+            ttl (:obj:`float`): seconds during which the value is valid
+
+        '''
+        with self.lock:
+            self.entries[key] = (value, time.time() + ttl)
+
+    def clear(self):
+        '''
+        Removes all the cached values
+
+        '''
+        with self.lock:
+            self.entries.clear()
+
+
+# address and reachability of (server, port) pairs shared by the whole process
+DNS_CACHE = TTLCache()
+RESOLVED_TTL = 300
+UNRESOLVED_TTL = 30
+REACHABILITY_CACHE = TTLCache()
+REACHABLE_TTL = 60
+UNREACHABLE_TTL = 10
+
+
+def resolve(server, port=22):
+    '''Resolves the address of a server, using the process-wide resolver cache
+
+    Successful resolutions are cached for RESOLVED_TTL seconds, failed ones for
+    UNRESOLVED_TTL.
+
+    Arguments:
+        server (:obj:`str`): remote server
+        port (:obj:`int`): tcp port (default: 22)
+
+    Returns:
+        :obj:`tuple`: address family, socket type, protocol and socket address, as given by
+        :func:`socket.getaddrinfo`, or None if the server can't be resolved
+
+    '''
+    cached, address_info = DNS_CACHE.get((server, port))
+    if cached:
+        return address_info
+    try:
+        family, socktype, proto, _, address = socket.getaddrinfo(
+            server, port, 0, socket.SOCK_STREAM)[0]
+        address_info = (family, socktype, proto, address)
+    except (socket.error, socket.gaierror):
+        address_info = None
+    DNS_CACHE.set((server, port), address_info,
+                  RESOLVED_TTL if address_info else UNRESOLVED_TTL)
+    return address_info
+
+
+def resolve_all(servers, port=22, workers=32):
+    '''Resolves the addresses of many servers concurrently, filling the resolver cache
+
+    Arguments:
+        servers (:obj:`list`): remote servers
+        port (:obj:`int`): tcp port (default: 22)
+        workers (:obj:`int`): number of simultaneous resolutions (default: 32)
+
+    Returns:
+        :obj:`dict`: address of each server (see :func:`resolve`)
+
+    '''
+    pending = [server for server in set(servers) if not DNS_CACHE.get((server, port))[0]]
+
+    def worker():
+        while True:
+            try:
+                server = pending.pop()
+            except IndexError:
+                return
+            resolve(server, port)
+    threads = [threading.Thread(target=worker) for _ in range(min(workers, len(pending)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return dict((server, resolve(server, port)) for server in servers)
+
+
+def open_socket(address_info, timeout=None):
+    '''Opens a tcp connection, with Nagle's algorithm disabled, to an address given by
+    :func:`resolve`
+
+    Arguments:
+        address_info (:obj:`tuple`): resolved address
+        timeout (:obj:`float`): connection timeout in seconds (default: None)
+
+    Returns:
+        :obj:`socket.socket`: connected socket
+
+    '''
+    family, socktype, proto, address = address_info
+    sock = socket.socket(family, socktype, proto)
+    sock.settimeout(timeout)
+    try:
+        # small requests such as channel opens must not wait for the ack of the previous
+        # packet (Nagle's algorithm against delayed acks costs up to 40ms per round trip)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.connect(address)
+    except socket.error:
+        sock.close()
+        raise
+    return sock
+
+
+def probe_server(server, port=22, timeout=1.0):
+    '''Checks if a tcp port of a server accepts connections
+
+    Arguments:
+        server (:obj:`str`): remote server
+        port (:obj:`int`): tcp port (default: 22)
+        timeout (:obj:`float`): seconds to wait for the connection (default: 1.0)
+
+    Returns:
+        :obj:`bool`: *True* if the port is reachable, *False* otherwise
+
+    '''
+    return probe_servers([server], port, timeout)[server]
+
+
+def probe_servers(servers, port=22, timeout=1.0):
+    '''Checks, all at once, if a tcp port of many servers accepts connections
+
+    Non-blocking connections are started to every server not found in the reachability
+    cache and watched together with poll (or select where poll is not available). Positive
+    results are cached for REACHABLE_TTL seconds, negative ones for UNREACHABLE_TTL. The
+    servers are resolved concurrently beforehand (see :func:`resolve_all`).
+
+    Arguments:
+        servers (:obj:`list`): remote servers
+        port (:obj:`int`): tcp port (default: 22)
+        timeout (:obj:`float`): seconds to wait for the connections (default: 1.0)
+
+    Returns:
+        :obj:`dict`: reachability (:obj:`bool`) of each server
+
+    '''
+    results = {}
+    pending = {}
+    probed = []
+    for server in servers:
+        cached, reachable = REACHABILITY_CACHE.get((server, port))
+        if cached:
+            results[server] = reachable
+        else:
+            probed.append(server)
+    addresses = resolve_all(probed, port)
+    for server in probed:
+        if not addresses[server]:
+            results[server] = False
+            continue
+        family, socktype, proto, address = addresses[server]
+        try:
+            sock = socket.socket(family, socktype, proto)
+        except socket.error:
+            results[server] = False
+            continue
+        sock.setblocking(0)
+        error = sock.connect_ex(address)
+        if error in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            pending[sock.fileno()] = (server, sock)
+        else:
+            sock.close()
+            results[server] = False
+    deadline = time.time() + timeout
+    poller = select.poll() if hasattr(select, 'poll') else None
+    if poller:
+        for fileno in pending:
+            poller.register(fileno, select.POLLOUT)
+    while pending:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        if poller:
+            ready = [fileno for fileno, _ in poller.poll(int(remaining * 1000) + 1)]
+        else:
+            ready = select.select([], list(pending), [], remaining)[1]
+        for fileno in ready:
+            server, sock = pending.pop(fileno)
+            if poller:
+                poller.unregister(fileno)
+            results[server] = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0
+            sock.close()
+    for server, sock in pending.values():
+        sock.close()
+        results[server] = False
+    for server in probed:
+        REACHABILITY_CACHE.set((server, port), results[server],
+                               REACHABLE_TTL if results[server] else UNREACHABLE_TTL)
+    return results
@@ -0,0 +1,190 @@
+#!/usr/bin/python
+import threading
+import time
+from collections import OrderedDict
+from loggers import Loggers
+from .ssh_paramiko import RemoteServer
+
+
+class RemoteServerPool(Loggers):
+    ''' Pool of live connections to many remote servers
+
+    Keeps one connected :class:`RemoteServer` per (server, ssh port, username, ssh key) and
+    hands it out again on later requests, so repeated jobs against the same servers do not
+    pay for the ssh handshake twice. Dead connections are reconnected when they are handed
+    out again (see :meth:`RemoteServer.reconnect`); idle connections, connections that can't
+    be reconnected and the least recently used ones when the pool is full are evicted.
+
+    The pool itself is thread-safe, but the servers it hands out are not: every caller asking
+    for the same server gets the same :class:`RemoteServer`, whose shell, sftp client and
+    ``last_exit_status`` are shared. Use a pooled server from one thread at a time (e.g. one
+    job per server, as :class:`FleetExecutor` does).
+
+    Arguments:
+        max_size(:obj:`int`, optional, *default* =64): maximum number of open connections
+        idle_timeout(:obj:`int`, optional, *default* =300): seconds after which an unused
+            connection is closed (None never closes idle connections)
+        keepalive(:obj:`int`, optional, *default* =30): interval in seconds of the transport
+            keep-alive packets (0 disables them), unless *server_args* sets it
+        log_folder(:obj:`str`, optional, *default* =None): folder where the log files of
+            this class will be generated
+        server_args(:obj:`dict`, optional, *default* ={}): default keyword arguments of the
+            :class:`RemoteServer` instances created by the pool
+
+    '''
+    def __init__(self, **kwargs):
+        opt_args = {
+            'max_size': 64,
+            'idle_timeout': 300,
+            'keepalive': 30,
+            'log_folder': None,
+            'server_args': {}
+            }
+        opt_args.update(kwargs)
+        if not opt_args['log_folder']:
+            super(RemoteServerPool, self).__init__('ssh_paramiko_pool')
+        else:
+            super(RemoteServerPool, self).__init__('ssh_paramiko_pool',
+                                                   log_folder_path=opt_args['log_folder'])
+        self.max_size = opt_args['max_size']
+        self.idle_timeout = opt_args['idle_timeout']
+        self.keepalive = opt_args['keepalive']
+        self.server_args = opt_args['server_args']
+        self.connections = OrderedDict()
+        self.lock = threading.RLock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'reconnects': 0}
+
+    def get_server(self, server, key_ssh=None, ping=True, **kwargs):
+        '''Returns a connected :class:`RemoteServer` for a server
+
+        A live pooled connection is reused if there is one; otherwise a new one is created,
+        connected and added to the pool. The returned server is shared with any other caller
+        of the same server and must not be used by two threads at once.
+
+        Arguments:
+            server (:obj:`str`): remote server
+            key_ssh(:obj:`str`): path of the ssh private key to connect
+            ping (:obj:`bool`, *default* = True): if False, ignores if the remote server
+                does not ping back
+            kwargs: keyword arguments of :class:`RemoteServer`, overriding *server_args*
+
+        Returns:
+            remote_server (:obj:`RemoteServer`): connected server, None if cannot connect
+        Returns:
+            msg (:obj:`str`): Message of error if cannot connect, empty string otherwise
+
+        '''
+        server_args = {'keepalive': self.keepalive or None}
+        server_args.update(self.server_args)
+        server_args.update(kwargs)
+        key = (server, server_args.get('ssh_port', 22), server_args.get('username', 'root'),
+               key_ssh)
+        dead_server = None
+        with self.lock:
+            self.evict_idle()
+            entry = self.connections.pop(key, None)
+            if entry:
+                remote_server = entry[0]
+                if self.is_alive(remote_server):
+                    self.stats['hits'] += 1
+                    self.connections[key] = [remote_server, time.time()]
+                    return remote_server, ''
+                self.log.debug('Pooled connection with server '+str(server)+' is dead.')
+                dead_server = remote_server
+        # a dead connection is reconnected outside the lock, as new connections are made
+        if dead_server and dead_server.server and dead_server.reconnect()[0]:
+            remote_server = dead_server
+            with self.lock:
+                self.stats['reconnects'] += 1
+        else:
+            with self.lock:
+                if dead_server:
+                    self.evict(dead_server)
+                self.stats['misses'] += 1
+            remote_server = RemoteServer(key_ssh, **server_args)
+            ret, msg = remote_server.connect_server(server, ping)
+            if not ret:
+                return None, msg
+        with self.lock:
+            # another thread may have pooled a connection to the same server meanwhile
+            entry = self.connections.pop(key, None)
+            if entry:
+                self.log.debug('Closing duplicated connection with server '+str(server))
+                self.evict(remote_server)
+                remote_server = entry[0]
+            while len(self.connections) >= self.max_size:
+                self.evict(self.connections.popitem(last=False)[1][0])
+            self.connections[key] = [remote_server, time.time()]
+        return remote_server, ''
+
+    def evict_idle(self):
+        '''
+        Closes the connections that have been idle for longer than *idle_timeout*
+
+        '''
+        if self.idle_timeout is None:
+            return
+        limit = time.time() - self.idle_timeout
+        with self.lock:
+            for key, entry in list(self.connections.items()):
+                if entry[1] < limit:
+                    del self.connections[key]
+                    self.evict(entry[0])
+
+    def evict(self, remote_server):
+        '''Closes a connection that was removed from the pool
+
+        Arguments:
+            remote_server (:obj:`RemoteServer`): evicted server
+
+        '''
+        self.stats['evictions'] += 1
+        self.log.debug('Evicting connection with server '+str(remote_server.server))
+        remote_server.drop_connection()
+
+    def discard(self, remote_server):
+        '''Removes a connection from the pool and closes it, such as one whose operation was
+        abandoned in an unknown state
+
+        Arguments:
+            remote_server (:obj:`RemoteServer`): connection handed out by the pool
+
+        '''
+        with self.lock:
+            for key, entry in list(self.connections.items()):
+                if entry[0] is remote_server:
+                    del self.connections[key]
+                    break
+            if remote_server.server:
+                self.evict(remote_server)
+
+    def close_all(self):
+        '''
+        Closes all the pooled connections
+
+        '''
+        with self.lock:
+            while self.connections:
+                self.evict(self.connections.popitem(last=False)[1][0])
+
+    @staticmethod
+    def is_alive(remote_server):
+        '''Checks if the transports of a pooled server are still active
+
+        Arguments:
+            remote_server (:obj:`RemoteServer`): pooled server
+
+        Returns:
+            :obj:`bool`: *True* if the connection can be reused, *False* otherwise
+
+        '''
+        return remote_server.is_connected()
+
+    def __len__(self):
+        return len(self.connections)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close_all()
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+import binascii
+import os
+import select
+import socket
+import threading
+import time
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+from .lazy import LazyModule
+
+paramiko = LazyModule('paramiko')
+
+
+def frame_command(cmd, marker, subshell=False):
+    '''Wraps a command so its output is delimited by a marker
+
+    The command standard output is followed by a line with the marker and the command exit
+    status, and its standard error by a line with the marker alone. The command reads its
+    standard input from /dev/null, so it can't consume the script it is part of.
+
+    Arguments:
+        cmd (:obj:`str`): command
+        marker (:obj:`str`): unique delimiter
+        subshell (:obj:`bool`, *default* = False): if True, the command runs in a subshell,
+            so an ``exit`` or a change of directory or variables doesn't reach the shell
+
+    Returns:
+        :obj:`str`: shell script line
+
+    '''
+    command = 'command eval '+quote(cmd)
+    if subshell:
+        command = '('+command+')'
+    return (command+' </dev/null; printf \'\\n%s %d\\n\' '+marker+' $?; '
+            'printf \'\\n%s\\n\' '+marker+' >&2\n')
+
+
+def new_markers(count=1):
+    '''Creates unique markers for :func:`frame_command`, none a prefix of another
+
+    Arguments:
+        count (:obj:`int`): number of markers
+
+    Returns:
+        :obj:`list`: markers
+
+    '''
+    base = binascii.hexlify(os.urandom(16)).decode('ascii')
+    return [base+'.'+str(index)+'.' for index in range(count)]
+
+
+def parse_frame(data, marker, with_status):
+    '''Extracts the first framed output from data read from a channel stream
+
+    Arguments:
+        data (:obj:`bytes`): data read so far
+        marker (:obj:`str`): delimiter of the frame
+        with_status (:obj:`bool`): True for standard output frames, which carry the exit
+            status
+
+    Returns:
+        :obj:`tuple`: frame content (:obj:`bytes`), exit status (None for standard error
+        frames) and remaining data, or None if the frame is not complete yet
+
+    '''
+    token = ('\n'+marker+(' ' if with_status else '\n')).encode('ascii')
+    position = data.find(token)
+    if position < 0:
+        return None
+    content, rest = data[:position], data[position + len(token):]
+    status = None
+    if with_status:
+        end = rest.find(b'\n')
+        if end < 0:
+            return None
+        status, rest = int(rest[:end]), rest[end + 1:]
+    return content, status, rest
+
+
+class PersistentShell(object):
+    ''' Remote shell that runs many commands over a single channel
+
+    A shell is started once in its own channel and each command is written to its standard
+    input, framed by :func:`frame_command`, so commands cost a round trip each without any
+    channel setup or new remote process for the shell. Commands run in the same shell
+    process, so changes such as *cd* or exported variables persist between them.
+
+    Arguments:
+        transport (:obj:`paramiko.Transport`): authenticated transport
+        shell (:obj:`str`, optional, *default* =/bin/sh): remote shell command
+
+    '''
+    def __init__(self, transport, shell='/bin/sh'):
+        self.chan = transport.open_session()
+        self.chan.exec_command(shell)
+        self.lock = threading.Lock()
+
+    def execute(self, cmd, timeout=20, chunk_size=32768):
+        '''Executes a command in the shell
+
+        Arguments:
+            cmd (:obj:`str`): command
+            timeout (:obj:`int`): seconds without any output after which the command is
+                abandoned (default: 20)
+            chunk_size (:obj:`int`): maximum size of each read (default: 32768)
+
+        Returns:
+            :obj:`tuple`: command standard output (:obj:`bytes`), standard error
+            (:obj:`bytes`) and exit status
+
+        Raises:
+            :obj:`paramiko.SSHException`: if the shell is no longer running
+            :obj:`socket.timeout`: if no output arrives within *timeout* seconds
+
+        '''
+        chan = self.chan
+        marker = new_markers()[0]
+        with self.lock:
+            chan.sendall(frame_command(cmd, marker).encode('utf-8'))
+            stdout, stderr = b'', b''
+            stdout_frame, stderr_frame = None, None
+            last_data = time.time()
+            while stdout_frame is None or stderr_frame is None:
+                received = False
+                if chan.recv_ready():
+                    stdout += chan.recv(chunk_size)
+                    received = True
+                if chan.recv_stderr_ready():
+                    stderr += chan.recv_stderr(chunk_size)
+                    received = True
+                if received:
+                    last_data = time.time()
+                    if stdout_frame is None:
+                        stdout_frame = parse_frame(stdout, marker, True)
+                    if stderr_frame is None:
+                        stderr_frame = parse_frame(stderr, marker, False)
+                elif chan.closed or chan.exit_status_ready():
+                    raise paramiko.SSHException('The remote shell is no longer running')
+                elif time.time() - last_data > timeout:
+                    raise socket.timeout('No output received for '+str(timeout)+' seconds')
+                else:
+                    select.select([chan], [], [], 0.1)
+        return stdout_frame[0], stderr_frame[0], stdout_frame[1]
+
+    def is_active(self):
+        '''Checks if the shell is still running
+
+        Returns:
+            :obj:`bool`: *True* if the shell can run commands, *False* otherwise
+
+        '''
+        return not self.chan.closed and not self.chan.exit_status_ready()
+
+    def close(self):
+        '''
+        Ends the shell and closes its channel
+
+        '''
+        self.chan.close()
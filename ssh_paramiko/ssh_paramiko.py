@@ -1,11 +1,47 @@
 #!/usr/bin/python
+import select
 import socket
 import re
 import subprocess
-import hashlib
+import json
+import os
+import posixpath
+import random
+import stat
 import sys
+import threading
+import time
+from contextlib import contextmanager
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
 from loggers import Loggers
-import paramiko
+from .hostkeys import KnownHostsPolicy, KnownHostsStore, get_known_hosts, host_key_name
+from .keys import agent_keys, load_private_key
+from .lazy import LazyModule
+from .hashing import CHUNK_SIZE, REMOTE_HASH_COMMANDS, HashingFile, compression_ratio, \
+    hash_bytes, hash_file_object, hash_local_file, new_hash
+from .netutils import open_socket, probe_server, resolve
+from .shell import PersistentShell, frame_command, new_markers, parse_frame
+
+paramiko = LazyModule('paramiko')
+
+CHUNKED_TRANSFER_SIZE = 16 * 1048576
+COMPRESSION_SAMPLE_SIZE = 65536
+# minimum ratio (original / compressed size) of a sample to compress a transfer in auto mode
+AUTO_COMPRESSION_RATIO = 1.5
+
+def to_str(data):
+    '''Decodes bytes read from a channel into text (no-op for text)'''
+    if isinstance(data, bytes) and not isinstance(data, str):
+        return data.decode('utf-8', 'replace')
+    return data
+
 
 class RemoteServer(Loggers):
     ''' Access remote server
@@ -14,18 +50,77 @@ class RemoteServer(Loggers):
     between a host and a server.
 
     Arguments:
-        key_ssh(:obj:`str`): path of the ssh private key to connect (must be None if using
-            user and pasword to connect)
+        key_ssh(:obj:`str`): path of the ssh private key (Ed25519, ECDSA, RSA or DSS) to
+            connect (must be None if using user and pasword or the ssh agent to connect)
         log_folder(:obj:`str`, **optional** , *default* =None): folder where the log files
             of this class will be generated
         username(:obj:`str`, *optional* , *default* =root):  username using the connection
         password(:obj:`str`,optional, *default* =None):  password for connection if using
             user and password instead of key
+        key_password(:obj:`str`, optional, *default* =None): passphrase of an encrypted
+            private key
+        use_agent(:obj:`bool`, optional, *default* =False): if True, the keys of the running
+            ssh agent are also offered to the server, and no private key or password is
+            required to connect
         ssh_port(:obj:`str`, optional, *default* =22):  ssh tcp port
         server_has_dns(:obj:`bool`, optional, *default* =True): if the server is not registered
             in a _d_n_s domain and/or has not its _d_n_s name equals to its hostname, this flag must
             be set to False, otherwise this condition will be checked to certify we are trully
             connected to the right server.
+        sftp_support(:obj:`bool`, optional, *default* =True): if False, no sftp session is
+            created and file transfers are not available
+        sftp_shared_transport(:obj:`bool`, optional, *default* =False): if True, the sftp
+            subsystem is opened as a channel over the already established ssh transport the
+            first time it is needed, instead of negotiating a second ssh session at connection
+            time
+        verify_interval(:obj:`int`, optional, *default* =None): seconds after which the
+            identity of an already verified server is checked again on the same transport
+            (None checks it only once per transport)
+        hash_algorithm(:obj:`str`, optional, *default* =sha1): algorithm used to validate
+            transfered files (any hashlib algorithm, such as sha256 or blake2b, or xxh64 if
+            the xxhash module is installed)
+        hash_chunk_size(:obj:`int`, optional, *default* =1048576): size of the chunks read
+            when hashing files
+        window_size(:obj:`int`, optional, *default* =None): ssh channel window size, in
+            bytes, of the ssh and sftp transports (None keeps the paramiko default); larger
+            windows raise the throughput of high-latency links
+        max_packet_size(:obj:`int`, optional, *default* =None): maximum ssh packet size, in
+            bytes, of the ssh and sftp transports (None keeps the paramiko default)
+        prefetch_depth(:obj:`int`, optional, *default* =None): maximum number of sftp read
+            requests in flight when downloading files (None keeps the paramiko default;
+            requires paramiko 3.3 or later)
+        compression(:obj:`bool` or :obj:`str`, optional, *default* =False): if True, ssh
+            compression is enabled for the whole connection; if *auto*, each file transfer
+            samples the beginning of the file and only compressible content is transfered
+            over a dedicated compressed transport
+        reachability(:obj:`str`, optional, *default* =tcp): how connect_server checks if the
+            server is reachable: *tcp* tries a connection to the ssh port, *icmp* pings it
+        reachability_timeout(:obj:`float`, optional, *default* =1.0): seconds to wait for
+            the tcp reachability check
+        known_hosts(:obj:`str` or :obj:`KnownHostsStore`, optional, *default* =None): known
+            hosts file used to verify and record the server host keys, loaded once and
+            shared by the whole process (None keeps the keys in a process-wide in-memory
+            store); a server whose key was already known is identified by it, without the
+            *hostname* check, and the key of a new server is only recorded once that check
+            passes
+        reject_unknown_hosts(:obj:`bool`, optional, *default* =False): if True, servers
+            whose host key is not known are rejected, instead of added to *known_hosts*
+        metrics(:obj:`callable`, optional, *default* =None): hook called with the metric
+            name, the value and a dict of labels for each timing and byte count recorded in
+            the connection, command and transfer paths, such as a
+            :class:`ssh_paramiko.metrics.MetricsRegistry` (None records nothing)
+        keepalive(:obj:`int`, optional, *default* =None): interval in seconds of the
+            keep-alive packets of the ssh and sftp transports (None disables them); a
+            connection whose keep-alive packets can't be sent is detected as lost
+        retries(:obj:`int`, optional, *default* =3): number of times a lost connection is
+            reconnected before an operation fails; idempotent operations (server
+            verification, checksums and whole file transfers) interrupted by a transport
+            failure are also run again (0 disables reconnection)
+        retry_backoff(:obj:`float`, optional, *default* =0.5): seconds waited before the
+            second reconnection attempt, doubled for each further attempt (the first
+            attempt is immediate)
+        retry_backoff_max(:obj:`float`, optional, *default* =10.0): maximum seconds waited
+            between reconnection attempts
 
     '''
     def __init__(self, key_ssh, **kwargs):
@@ -33,28 +128,138 @@ class RemoteServer(Loggers):
             'log_folder': None,
             'username': 'root',
             'password': None,
+            'key_password': None,
+            'use_agent': False,
             'ssh_port': 22,
             'server_has_dns': True,
-            'sftp_support': True
+            'sftp_support': True,
+            'sftp_shared_transport': False,
+            'verify_interval': None,
+            'hash_algorithm': 'sha1',
+            'hash_chunk_size': CHUNK_SIZE,
+            'window_size': None,
+            'max_packet_size': None,
+            'prefetch_depth': None,
+            'compression': False,
+            'reachability': 'tcp',
+            'reachability_timeout': 1.0,
+            'known_hosts': None,
+            'reject_unknown_hosts': False,
+            'metrics': None,
+            'keepalive': None,
+            'retries': 3,
+            'retry_backoff': 0.5,
+            'retry_backoff_max': 10.0
             }
         opt_args.update(kwargs)
-        if not opt_args['log_folder']:
-            super(RemoteServer, self).__init__('ssh_paramiko')
-        else:
-            super(RemoteServer, self).__init__('ssh_paramiko',
-                                               log_folder_path=opt_args['log_folder'])
+        # the log handlers are configured the first time the log is used (see log)
+        self._log_args = {'log_folder_path': opt_args['log_folder']} \
+            if opt_args['log_folder'] else {}
+        self._log = None
+        self._log_ready = False
+        self._log_setting_up = False
+        self._log_lock = threading.RLock()
         self.ssh_time_out = 4
         self.server = None
+        self.address = None
         self.username = opt_args['username']
         self.password = opt_args['password']
         self.ssh_port = opt_args['ssh_port']
         self.server_has_dns = opt_args['server_has_dns']
         self.sftp_support = opt_args['sftp_support']
-        self.private_key = paramiko.RSAKey.from_private_key_file(key_ssh) if key_ssh else None
-        self.ssh_client = paramiko.SSHClient()
-        self.ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.sftp_shared_transport = opt_args['sftp_shared_transport']
+        self.key_ssh = key_ssh
+        self.key_password = opt_args['key_password']
+        self._private_key = None
+        self.use_agent = opt_args['use_agent']
+        self._ssh_client = None
+        known_hosts = opt_args['known_hosts']
+        self.known_hosts = known_hosts if isinstance(known_hosts, KnownHostsStore) \
+            else get_known_hosts(known_hosts)
+        self.host_key_policy = KnownHostsPolicy(self.known_hosts,
+                                                opt_args['reject_unknown_hosts'])
         self.sftp_client = None
+        self.sftp_transport = None
         self.transport = None
+        self.verify_interval = opt_args['verify_interval']
+        self.verified_identity = None
+        self.verified_at = 0
+        self.verification_stats = {'round_trips': 0, 'avoided': 0}
+        # commands (e.g. checksums) also run from the transfer worker threads
+        self.verification_lock = threading.Lock()
+        self.last_exit_status = None
+        self.shell = None
+        self.hash_algorithm = opt_args['hash_algorithm']
+        self.hash_chunk_size = opt_args['hash_chunk_size']
+        self.last_validation = {}
+        self.window_size = opt_args['window_size']
+        self.max_packet_size = opt_args['max_packet_size']
+        self.prefetch_depth = opt_args['prefetch_depth']
+        self.compression = opt_args['compression']
+        self.compressed_sftp_client = None
+        self.compressed_sftp_transport = None
+        self.last_transfer = {}
+        self.reachability = opt_args['reachability']
+        self.reachability_timeout = opt_args['reachability_timeout']
+        self.metrics = opt_args['metrics']
+        self.keepalive = opt_args['keepalive']
+        self.retries = opt_args['retries']
+        self.retry_backoff = opt_args['retry_backoff']
+        self.retry_backoff_max = opt_args['retry_backoff_max']
+        self.reconnect_count = 0
+        self.reconnect_lock = threading.RLock()
+        self.reconnect_thread = None
+
+    @property
+    def log(self):
+        '''Logger of the instance, whose handlers are configured on first use'''
+        if not self._log_ready:
+            self.setup_log()
+        return self._log
+
+    @log.setter
+    def log(self, log):
+        self._log = log
+
+    def setup_log(self):
+        '''
+        Configures the log handlers (see :class:`loggers.Loggers`), if not configured yet
+
+        '''
+        with self._log_lock:
+            # Loggers uses the log while configuring it: that use gets the bare logger
+            if not self._log_ready and not self._log_setting_up:
+                self._log_setting_up = True
+                super(RemoteServer, self).__init__('ssh_paramiko', **self._log_args)
+                self._log_ready = True
+
+    def set_log_rotate_handler(self, set_file):
+        self.setup_log()
+        super(RemoteServer, self).set_log_rotate_handler(set_file)
+
+    def set_log_level(self, log_level):
+        self.setup_log()
+        super(RemoteServer, self).set_log_level(log_level)
+
+    def set_log_format(self, log_type, log_format):
+        self.setup_log()
+        super(RemoteServer, self).set_log_format(log_type, log_format)
+
+    @property
+    def private_key(self):
+        '''Private key of the connection, loaded on first use (None if there is no key)'''
+        if self._private_key is None and self.key_ssh:
+            # keys are parsed once per process (see ssh_paramiko.keys.load_private_key)
+            self._private_key = load_private_key(self.key_ssh, self.key_password)
+        return self._private_key
+
+    @property
+    def ssh_client(self):
+        '''ssh client of the connection, created on first use'''
+        if self._ssh_client is None:
+            self._ssh_client = paramiko.SSHClient()
+            self._ssh_client.set_missing_host_key_policy(self.host_key_policy)
+        return self._ssh_client
 
     def connect_server(self, server, ping=True):
         '''Connects a host and a server via ssh
@@ -63,7 +268,7 @@ class RemoteServer(Loggers):
 
             server (:obj:`str`): remote server
             ping (:obj:`bool`, *default* = True): if False, ignores if the remote server
-                does not ping back
+                is not reachable (see *reachability*)
 
         Returns:
             ret (:obj:`bool`): True if successfully connected, False otherwise
@@ -71,75 +276,117 @@ class RemoteServer(Loggers):
             msg (:obj:`str`): Message of error if cannot connect, empty string otherwise
 
         '''
-        try:
-            socket.gethostbyname(server)
-        except socket.gaierror:
-            if self.server_has_dns:
-                self.log.error('Error! Server '+str(server)+' is not registered in DNS!')
-                return False, 'Server is not registered in DNS'
+        # the address is resolved once (per resolver cache ttl) and used by every transport
+        with self.timed('dns', server=server):
+            address = resolve(server, self.ssh_port)
+        if address is None and self.server_has_dns:
+            self.log.error('Error! Server '+str(server)+' is not registered in DNS!')
+            return False, 'Server is not registered in DNS'
         # Checking if there is an active connection
+        if self.server and not self.is_connected():
+            self.log.warning('Connection with server '+str(self.server)+' was lost.')
+            self.drop_connection()
         if self.server:
             try:
-                ret, hostname, error = self.execute_cmd('hostname')
+                ret = self.verify_server()
             except Exception as error:
-                self.log.error("Could't execute command 'hostname': "+str(error))
+                self.log.error("Could't verify the active connection: "+str(error))
                 ret = False
-            if ret or not self.server_has_dns:
-                if hostname.strip('\n\r')[0:4] == server or not self.server_has_dns:
+            if ret:
+                if self.server == server or not self.server_has_dns:
                     self.log.info('Server '+str(server)+' is already connected.')
                     return True, ''
                 else:
                     self.log.warning('Connection still active with the server: '
-                                     +hostname.strip('\n\r')[0:4]+'. Disconnecting...')
-                    self.ssh_client.close()
-                    if self.sftp_client: self.sftp_client.close()
+                                     +self.server+'. Disconnecting...')
+                    self.drop_connection()
             else:
                 self.log.debug('Error while checking if login is active')
                 return False, 'Error while checking if login is active'
         self.server = server
+        self.address = address
         try:
             self.log.debug("Connecting to server "+server)
-            #_ping server if ping is enabled
-            if (ping and self.ping_server(server)) if ping else True:
-                if self.private_key or (self.username and self.password):
+            #_check if the server is reachable if ping is enabled
+            if (ping and self.is_reachable(server)) if ping else True:
+                if self.private_key or self.use_agent or (self.username and self.password):
                     self.log.debug('Initiating connection with server '+str(server)+'...')
-                    self.ssh_client.connect(server, username=self.username,
-                                            password=self.password, pkey=self.private_key,
-                                            timeout=self.ssh_time_out)
+                    sock = self.open_server_socket()
+                    self.host_key_policy.last_match = None
+                    self.host_key_policy.discard()
+                    with self.timed('handshake'):
+                        self.ssh_client.connect(server, port=self.ssh_port,
+                                                username=self.username, password=self.password,
+                                                pkey=self.private_key,
+                                                allow_agent=self.use_agent,
+                                                look_for_keys=False,
+                                                timeout=self.ssh_time_out,
+                                                compress=self.compression is True, sock=sock)
                     self.transport = self.ssh_client.get_transport()
-                    if self.sftp_support:
+                    if self.host_key_policy.last_match:
+                        # a host key already in the store (read from the known hosts file or
+                        # confirmed by a verified connection) identifies the server as the
+                        # hostname check would
+                        self.verified_identity = self.transport_identity()
+                        self.verified_at = time.time()
+                    if self.window_size:
+                        self.transport.default_window_size = self.window_size
+                    if self.max_packet_size:
+                        self.transport.default_max_packet_size = self.max_packet_size
+                    if self.keepalive:
+                        self.transport.set_keepalive(self.keepalive)
+                    if self.sftp_support and not self.sftp_shared_transport:
                         self.log.debug('Instantiating transport object for sftp...')
-                        ssh_transport = paramiko.Transport((server, self.ssh_port))
-                        ssh_transport.connect(username=self.username, password=self.password,
-                                              pkey=self.private_key)
-                        self.sftp_client = paramiko.SFTPClient.from_transport(ssh_transport)
+                        ssh_transport = paramiko.Transport(self.open_server_socket(),
+                                                           **self._window_args('default_'))
+                        ssh_transport.use_compression(self.compression is True)
+                        with self.timed('handshake'):
+                            self.authenticate_transport(ssh_transport)
+                        if self.keepalive:
+                            ssh_transport.set_keepalive(self.keepalive)
+                        self.sftp_transport = ssh_transport
+                        self.sftp_client = self.open_sftp(ssh_transport)
                 else:
                     return False, 'Not ssh key path neither user and password.'
             else:
-                self.log.error('Server '+str(server)+' is not pinging back.\
-                               Aborting connection.')
+                self.log.error('Server '+str(server)+' is not reachable ('+self.reachability
+                               +' check). Aborting connection.')
                 self.server = None
-                return False, 'Server is not pinging back.'
+                return False, 'Server is not reachable.'
         except Exception as error:
             self.log.error('Error while connecting to server '+str(server)
                            +'. Error: '+str(error))
-            self.log.error('Warning! _in order to connect to other servers, you must\
-                           instantiate RemoteServer class again')
+            # the transports opened before the failure are closed, so the instance can
+            # connect again
+            self.drop_connection()
+            self.host_key_policy.discard()
             return False, str(error)
-        if (self.execute_cmd('hostname')[0] and \
-           (self.execute_cmd('hostname')[1]).strip('\n\r')[0:4] == server) \
-           or not self.server_has_dns: return True, ''
+        if self.verify_server():
+            # a new host key is only trusted by later connections once the server is verified
+            self.host_key_policy.confirm()
+            return True, ''
         else:
+            self.host_key_policy.discard()
             self.log.error('Server '+str(server)+' is not connected')
             self.server = None
             return False, 'Server is not connected.'
 
-    def execute_cmd(self, cmd, timeout=20):
+    def execute_cmd(self, cmd, timeout=20, with_status=False, idempotent=False):
         '''_executes a command in a remote server shell
 
+        Standard output and standard error are read at the same time, and the command is
+        considered successful if its exit status is 0, whatever it writes to standard error.
+        A lost connection is reconnected before the command is sent; if the transport fails
+        while the command runs, it is only run again if it is *idempotent*.
+
         Arguments:
             cmd (:obj:`str`): command
-            timeout (:obj:`str`): timeout to the command execution (default: 20)
+            timeout (:obj:`str`): seconds without any output after which the command is
+                abandoned (default: 20)
+            with_status (:obj:`bool`): if True, the exit status is returned as well
+                (default: False)
+            idempotent (:obj:`bool`): if True, the command can safely run more than once,
+                and is retried after a transport failure (default: False)
 
         Returns:
             ret (:obj:`bool`): True if command successfully executed, False otherwise
@@ -147,91 +394,504 @@ class RemoteServer(Loggers):
             output (:obj:`str`): command standard output
         Returns:
             error (:obj:`str`): command standard error
+        Returns:
+            exit_status (:obj:`int`): command exit status, None if it could not be obtained
+                (only if *with_status* is True)
 
         '''
-        ret = True
-        bufsize = -1
+        if not self.verify_server(timeout):
+            self.log.error('Can\'t verify if logged in the right server in order to issue the'
+                           ' command "'+cmd+'"')
+            result = (False, '', 'Can\'t verify if logged in the right server', None)
+            return result if with_status else result[:3]
         try:
-            if self.server_has_dns:
-                #_making sure we are really logged to the server
-                chan = self.transport.open_session()
-                chan.settimeout(timeout)
-                chan.exec_command("hostname")
-                stdout = chan.makefile('rb', bufsize)
-                stderr = chan.makefile_stderr('rb', bufsize)
-                error = ''.join(str(lines) for lines in stderr.readlines())
-                output = ''.join(str(lines) for lines in stdout.readlines())
-                if (len(error) > 0) or (output.strip('\n\r ')[0:4] != self.server)\
-                   and self.server_has_dns:
-                    self.log.error('Can\'t verify if logged in the right server in order'
-                                   'to issue the command "'+cmd+'": '+error)
-                    return False, output
+            if idempotent:
+                output, error, exit_status = self.call_with_retries(self._run_channel, cmd,
+                                                                    timeout)
             else:
-                pass
-            try:
-                chan = self.transport.open_session()
-                chan.settimeout(timeout)
-                chan.exec_command(cmd)
-                stdout = chan.makefile('rb', bufsize)
-                stderr = chan.makefile_stderr('rb', bufsize)
-                error = ''.join(str(lines) for lines in stderr.readlines())
-                output = ''.join(str(lines) for lines in stdout.readlines())
-                if len(error) > 0:
-                    self.log.error('Error while executing command "'+cmd+'": '+error)
-                    self.log.error('Command "'+cmd+'" output: '+output)
-                    ret = False
-            except (paramiko.SSHException, socket.error) as ssh_error:
-                self.log.error('Can\'t perform the command due to a socket timeout error: '
-                               +str(ssh_error)+' _server: '+self.server)
-                return False, 'Socket Timeout', 'Socket Timeout'
+                output, error, exit_status = self._run_channel(cmd, timeout)
+        except (paramiko.SSHException, socket.error, EOFError) as ssh_error:
+            self.log.error('Can\'t perform the command due to a socket timeout error: '
+                           +str(ssh_error)+' _server: '+str(self.server))
+            result = (False, 'Socket Timeout', 'Socket Timeout', None)
+            return result if with_status else result[:3]
+        if exit_status != 0:
+            self.log.error('Error while executing command "'+cmd+'" (exit status '
+                           +str(exit_status)+'): '+error)
+            self.log.error('Command "'+cmd+'" output: '+output)
+        result = (exit_status == 0, output, error, exit_status)
+        return result if with_status else result[:3]
+
+    def execute_cmd_stream(self, cmd, stdout_sink=None, stderr_sink=None, timeout=20,
+                           chunk_size=32768):
+        '''Executes a command in a remote server shell, streaming its output to sinks
+
+        The output is never buffered as a whole, so memory use does not depend on its size.
+
+        Arguments:
+            cmd (:obj:`str`): command
+            stdout_sink (:obj:`callable` or file-like): receives the standard output chunks
+                (:obj:`bytes`) as they arrive; discarded if None
+            stderr_sink (:obj:`callable` or file-like): receives the standard error chunks
+                (:obj:`bytes`) as they arrive; discarded if None
+            timeout (:obj:`int`): seconds without any output after which the command is
+                abandoned (default: 20)
+            chunk_size (:obj:`int`): maximum size of each chunk (default: 32768)
+
+        Returns:
+            ret (:obj:`bool`): True if command successfully executed, False otherwise
+        Returns:
+            exit_status (:obj:`int`): command exit status, None if it could not be obtained
+
+        '''
+        sinks = {}
+        for stream, sink in (('stdout', stdout_sink), ('stderr', stderr_sink)):
+            sinks[stream] = getattr(sink, 'write', sink)
+        try:
+            for stream, chunk in self.iter_cmd_output(cmd, timeout, chunk_size):
+                if sinks[stream]:
+                    sinks[stream](chunk)
         except (paramiko.SSHException, socket.error) as ssh_error:
+            self.log.error('Can\'t perform the command "'+cmd+'": '+str(ssh_error)
+                           +' Server: '+str(self.server))
+            return False, None
+        return self.last_exit_status == 0, self.last_exit_status
+
+    def iter_cmd_output(self, cmd, timeout=20, chunk_size=32768):
+        '''Executes a command in a remote server shell, yielding its output as it arrives
+
+        Standard output and standard error are read at the same time, so a command filling
+        one of them never blocks on the other. Once the generator is exhausted, the command
+        exit status is available in *last_exit_status*.
+
+        Arguments:
+            cmd (:obj:`str`): command
+            timeout (:obj:`int`): seconds without any output after which the command is
+                abandoned (default: 20)
+            chunk_size (:obj:`int`): maximum size of each chunk (default: 32768)
+
+        Returns:
+            :obj:`generator`: pairs of stream name ('stdout' or 'stderr') and output chunk
+            (:obj:`bytes`)
+
+        Raises:
+            :obj:`paramiko.SSHException`: if the server can't be verified or the command
+            can't be executed
+            :obj:`socket.timeout`: if no output arrives within *timeout* seconds
+
+        '''
+        self.last_exit_status = None
+        if not self.verify_server(timeout):
+            raise paramiko.SSHException('Can\'t verify if logged in the right server')
+        chan = self.transport.open_session()
+        try:
+            chan.exec_command(cmd)
+            for stream, chunk in self.drain_channel(chan, timeout, chunk_size):
+                yield stream, chunk
+            self.last_exit_status = chan.recv_exit_status()
+        finally:
+            chan.close()
+
+    @staticmethod
+    def drain_channel(chan, timeout=20, chunk_size=32768):
+        '''Reads standard output and standard error of a channel together until it finishes
+
+        Arguments:
+            chan (:obj:`paramiko.Channel`): channel of a running command
+            timeout (:obj:`int`): seconds without any output after which reading is
+                abandoned (None waits forever)
+            chunk_size (:obj:`int`): maximum size of each chunk
+
+        Returns:
+            :obj:`generator`: pairs of stream name ('stdout' or 'stderr') and output chunk
+
+        '''
+        last_data = time.time()
+        while True:
+            received = False
+            if chan.recv_ready():
+                received = True
+                yield 'stdout', chan.recv(chunk_size)
+            if chan.recv_stderr_ready():
+                received = True
+                yield 'stderr', chan.recv_stderr(chunk_size)
+            if received:
+                last_data = time.time()
+                continue
+            if chan.exit_status_ready() or chan.closed:
+                if not chan.recv_ready() and not chan.recv_stderr_ready():
+                    break
+            elif timeout is not None and time.time() - last_data > timeout:
+                raise socket.timeout('No output received for '+str(timeout)+' seconds')
+            else:
+                select.select([chan], [], [], 0.1)
+
+    def execute_batch(self, cmds, timeout=20):
+        '''Executes many commands in a remote server with a single channel and shell
+
+        The commands are sent as one script to a remote /bin/sh and run one after the other;
+        their outputs are delimited by :func:`ssh_paramiko.shell.frame_command` and split in
+        a single pass once the script ends. Each command runs in its own subshell, like
+        separate :meth:`execute_cmd` calls: an ``exit`` only ends that command, and
+        ``cd`` or variables don't carry over to the next ones.
+
+        Arguments:
+            cmds (:obj:`list`): commands
+            timeout (:obj:`int`): seconds without any output after which the batch is
+                abandoned (default: 20)
+
+        Returns:
+            :obj:`list`: (ret, output, error, exit_status) of each command, where ret is
+            True if the command exit status is 0
+
+        '''
+        failure = (False, '', '', None)
+        if not self.verify_server(timeout):
             self.log.error('Can\'t verify if logged in the right server in order to issue the'
-                           ' command, due to a socket timeout error: '+str(ssh_error)+' Server: '
-                           +self.server)
-            return False, 'Socket Timeout', 'Socket Timeout'
-        return ret, output, error
+                           ' batch of commands')
+            return [failure] * len(cmds)
+        markers = new_markers(len(cmds))
+        stdout, stderr = [], []
+        try:
+            chan = self.transport.open_session()
+            try:
+                chan.exec_command('/bin/sh')
+                chan.sendall(''.join(frame_command(cmd, marker, subshell=True) for cmd, marker
+                                     in zip(cmds, markers)).encode('utf-8'))
+                chan.shutdown_write()
+                for stream, chunk in self.drain_channel(chan, timeout):
+                    (stdout if stream == 'stdout' else stderr).append(chunk)
+            finally:
+                chan.close()
+        except (paramiko.SSHException, socket.error) as ssh_error:
+            self.log.error('Can\'t perform the batch of commands due to a socket error: '
+                           +str(ssh_error)+' Server: '+str(self.server))
+            return [failure] * len(cmds)
+        stdout, stderr = b''.join(stdout), b''.join(stderr)
+        results = []
+        for cmd, marker in zip(cmds, markers):
+            stdout_frame = parse_frame(stdout, marker, True)
+            stderr_frame = parse_frame(stderr, marker, False)
+            if stdout_frame is None or stderr_frame is None:
+                self.log.error('Command "'+cmd+'" of the batch did not run')
+                results.append(failure)
+                continue
+            output, exit_status, stdout = stdout_frame
+            error, _, stderr = stderr_frame
+            if exit_status != 0:
+                self.log.error('Command "'+cmd+'" exited with status '+str(exit_status))
+            results.append((exit_status == 0, to_str(output), to_str(error), exit_status))
+        return results
+
+    def execute_shell_cmd(self, cmd, timeout=20):
+        '''Executes a command in the persistent remote shell of the connection
+
+        The shell is started in its own channel on the first call and reused by the next
+        ones, so each command costs a single round trip, without opening a channel or
+        starting a new shell. Commands share the shell state (working directory, variables).
+
+        Arguments:
+            cmd (:obj:`str`): command
+            timeout (:obj:`int`): seconds without any output after which the command is
+                abandoned (default: 20)
+
+        Returns:
+            ret (:obj:`bool`): True if the command exit status is 0, False otherwise
+        Returns:
+            output (:obj:`str`): command standard output
+        Returns:
+            error (:obj:`str`): command standard error
+        Returns:
+            exit_status (:obj:`int`): command exit status, None if it could not be obtained
+
+        '''
+        try:
+            if self.shell is None or not self.shell.is_active():
+                if not self.verify_server(timeout):
+                    self.log.error('Can\'t verify if logged in the right server in order to'
+                                   ' start the remote shell')
+                    return False, '', 'Can\'t verify if logged in the right server', None
+                self.shell = PersistentShell(self.transport)
+            output, error, exit_status = self.shell.execute(cmd, timeout)
+        except (paramiko.SSHException, socket.error) as ssh_error:
+            self.log.error('Can\'t perform the command "'+cmd+'" in the remote shell: '
+                           +str(ssh_error)+' Server: '+str(self.server))
+            self.close_shell()
+            return False, 'Socket Timeout', 'Socket Timeout', None
+        output, error = to_str(output), to_str(error)
+        if exit_status != 0:
+            self.log.error('Command "'+cmd+'" exited with status '+str(exit_status)+': '+error)
+        return exit_status == 0, output, error, exit_status
+
+    def close_shell(self):
+        '''
+        Ends the persistent remote shell, if any
+
+        '''
+        if self.shell:
+            self.shell.close()
+        self.shell = None
+
+    def verify_server(self, timeout=20):
+        '''Checks if the active transport is really logged in the expected server
+
+        The remote *hostname* is checked only once per transport: the result is bound to the
+        transport and to the fingerprint of the server host key, so it is only checked again
+        after a reconnection or, if *verify_interval* is set, after that many seconds. A lost
+        connection is reconnected first (see :meth:`ensure_connected`).
+
+        Arguments:
+            timeout (:obj:`int`): timeout to the *hostname* command execution (default: 20)
+
+        Returns:
+            :obj:`bool`: *True* if logged in the right server (or if *server_has_dns* is
+            False), *False* otherwise
+
+        '''
+        if not self.ensure_connected():
+            return False
+        if self.is_verified():
+            return True
+        try:
+            self.count_verification('round_trips')
+            with self.timed('hostname_check'):
+                output, error, _ = self.call_with_retries(self._run_channel, 'hostname',
+                                                          timeout)
+        except (paramiko.SSHException, socket.error, EOFError, AttributeError) as ssh_error:
+            self.log.error('Can\'t verify if logged in the right server due to a socket'
+                           ' error: '+str(ssh_error)+' Server: '+str(self.server))
+            return False
+        return self.check_hostname(output, error)
+
+    def is_verified(self):
+        '''Checks if the server identity is already verified for the active transport
+
+        Returns:
+            :obj:`bool`: *True* if no *hostname* check is needed, *False* otherwise
+
+        '''
+        if not self.server_has_dns:
+            return True
+        identity = self.transport_identity()
+        if identity is not None and identity == self.verified_identity:
+            if self.verify_interval is None or \
+               time.time() - self.verified_at < self.verify_interval:
+                self.count_verification('avoided')
+                return True
+        self.verified_identity = None
+        return False
+
+    def count_verification(self, name):
+        '''Increments a counter of *verification_stats*
+
+        Arguments:
+            name (:obj:`str`): 'round_trips' or 'avoided'
+
+        '''
+        with self.verification_lock:
+            self.verification_stats[name] += 1
+
+    def check_hostname(self, output, error):
+        '''Checks the output of the remote *hostname* command, recording a successful check
+
+        Arguments:
+            output (:obj:`str`): *hostname* standard output
+            error (:obj:`str`): *hostname* standard error
+
+        Returns:
+            :obj:`bool`: *True* if logged in the right server, *False* otherwise
+
+        '''
+        if len(error) > 0 or output.strip('\n\r ')[0:4] != self.server:
+            self.log.error('Can\'t verify if logged in the right server '+str(self.server)
+                           +': '+error)
+            return False
+        self.verified_identity = self.transport_identity()
+        self.verified_at = time.time()
+        return True
+
+    def transport_identity(self):
+        '''Identity of the active ssh transport
+
+        Returns:
+            :obj:`tuple`: transport id and fingerprint of the server host key, or None if
+            there is no active transport
+
+        '''
+        if not self.transport or not self.transport.is_active():
+            return None
+        return id(self.transport), self.transport.get_remote_server_key().get_fingerprint()
+
+    def _run_channel(self, cmd, timeout):
+        '''Runs a command in a new channel of the active transport
+
+        Arguments:
+            cmd (:obj:`str`): command
+            timeout (:obj:`int`): seconds without any output after which the command is
+                abandoned
+
+        Returns:
+            :obj:`tuple`: command standard output, standard error and exit status
+
+        '''
+        stdout, stderr = [], []
+        with self.timed('channel_open'):
+            chan = self.transport.open_session()
+        try:
+            with self.timed('exec'):
+                chan.exec_command(cmd)
+            with self.timed('read'):
+                for stream, chunk in self.drain_channel(chan, timeout):
+                    (stdout if stream == 'stdout' else stderr).append(chunk)
+                exit_status = chan.recv_exit_status()
+                # paramiko reports -1 for a channel closed along with its transport
+                if exit_status == -1 and not chan.get_transport().is_active():
+                    raise paramiko.SSHException('Connection lost while running the command')
+        finally:
+            chan.close()
+        # other threads may run commands too: the returned status is the local one
+        self.last_exit_status = exit_status
+        stdout, stderr = b''.join(stdout), b''.join(stderr)
+        self.record_metric('ssh_paramiko_output_bytes', len(stdout), stream='stdout')
+        self.record_metric('ssh_paramiko_output_bytes', len(stderr), stream='stderr')
+        return to_str(stdout), to_str(stderr), exit_status
+
+    def record_metric(self, name, value, **labels):
+        '''Passes a measurement to the *metrics* hook, if any
+
+        The current server is added to the labels unless they already include it. Errors of
+        the hook are logged and never interrupt the measured operation.
+
+        Arguments:
+            name (:obj:`str`): metric name
+            value (:obj:`float`): measured value
+            labels: labels of the measurement
+
+        '''
+        if self.metrics is None:
+            return
+        labels.setdefault('server', str(self.server))
+        try:
+            self.metrics(name, value, labels)
+        except Exception as error:
+            self.log.warning('Error while recording metric '+name+': '+str(error))
+
+    @contextmanager
+    def timed(self, phase, **labels):
+        '''Context manager recording the duration of a phase as *ssh_paramiko_phase_seconds*
+
+        The duration is recorded even if the phase fails.
+
+        Arguments:
+            phase (:obj:`str`): name of the phase
+            labels: additional labels of the measurement
+
+        '''
+        if self.metrics is None:
+            yield
+            return
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record_metric('ssh_paramiko_phase_seconds', time.time() - start, phase=phase,
+                               **labels)
 
     def validate_files(self, local_file_path, remote_file_path):
-        '''_checks if a remote and local files has the same sha1sum
+        '''_checks if a remote and local files has the same checksum
+
+        Both files are hashed incrementally, in chunks of *hash_chunk_size* bytes, with the
+        *hash_algorithm* of the instance. The timings of the validation are kept in
+        *last_validation*.
 
         Arguments:
             local_file_path (:obj:`str`): path of the local file to be validated
             remote_file_path (:obj:`str`): path of the remote file to be validated
 
         Returns:
-            :obj:`bool`: *True* if files' sha1sums are the same, *False* otherwise
+            :obj:`bool`: *True* if files' checksums are the same, *False* otherwise
 
         '''
         if self.server:
-            with open(local_file_path, 'rb') as local_file:
-                sha1sum_local = hashlib.sha1(local_file.read()).hexdigest()
-            ret, output, error = self.execute_cmd('sha1sum '+remote_file_path)
-            if ret:
-                sha1sum_remote = output.split(' ')[0]
-                if sha1sum_local == sha1sum_remote:
-                    return True
-                self.log.error('Error: sha1 '+sha1sum_remote+' of remote file '+remote_file_path
-                               +' is not the same as sha1 '+sha1sum_local+' of local file '
-                               +local_file_path)
-            else:
-                try:
-                    remote_file_obj = self.sftp_client.open(remote_file_path)
-                    sha1sum_remote = hashlib.sha1(remote_file_obj.read()).hexdigest()
-                    remote_file_obj.close()
-                    if sha1sum_local == sha1sum_remote:
-                        return True
-                    self.log.error('Error: sha1 '+sha1sum_remote+' of remote file '+remote_file_path
-                                   +' is not the same as sha1 '+sha1sum_local+' of local file '
-                                   +local_file_path)
-                except Exception as error:
-                    self.log.warning('It was not possible to obtain sha1sum of remote file '
-                                     +remote_file_path+': '+str(error))
-            return False
+            start = time.time()
+            checksum_local = hash_local_file(local_file_path, self.hash_algorithm,
+                                             self.hash_chunk_size)
+            local_hash_time = time.time() - start
+            start = time.time()
+            checksum_remote = self.remote_checksum(remote_file_path)
+            return self.compare_checksums(local_file_path, remote_file_path, checksum_local,
+                                          checksum_remote, local_hash_time,
+                                          time.time() - start)
         else:
             self.log.error('No connection with any server is active now.')
             return False
 
-    def put_file(self, local_file_path, remote_file_path, callback=None):
+    def compare_checksums(self, local_file_path, remote_file_path, checksum_local,
+                          checksum_remote, local_hash_time=0, remote_hash_time=0):
+        '''Compares the checksums of a local and a remote file, recording the validation
+
+        Arguments:
+            local_file_path (:obj:`str`): path of the local file
+            remote_file_path (:obj:`str`): path of the remote file
+            checksum_local (:obj:`str`): checksum of the local file
+            checksum_remote (:obj:`str`): checksum of the remote file, None if unknown
+            local_hash_time (:obj:`float`): seconds spent hashing the local file
+            remote_hash_time (:obj:`float`): seconds spent obtaining the remote checksum
+
+        Returns:
+            :obj:`bool`: *True* if the checksums are the same, *False* otherwise
+
+        '''
+        self.last_validation = {
+            'algorithm': self.hash_algorithm,
+            'bytes': os.path.getsize(local_file_path),
+            'local_hash_time': local_hash_time,
+            'remote_hash_time': remote_hash_time
+            }
+        self.record_metric('ssh_paramiko_phase_seconds', local_hash_time, phase='local_hash')
+        self.record_metric('ssh_paramiko_phase_seconds', remote_hash_time, phase='remote_hash')
+        if checksum_remote is None:
+            return False
+        if checksum_local == checksum_remote:
+            return True
+        self.log.error('Error: '+self.hash_algorithm+' '+checksum_remote+' of remote file '
+                       +remote_file_path+' is not the same as '+self.hash_algorithm+' '
+                       +checksum_local+' of local file '+local_file_path)
+        return False
+
+    def remote_checksum(self, remote_file_path):
+        '''Obtains the checksum of a remote file
+
+        The checksum is computed by a command in the remote server; if that fails, the file is
+        read through sftp in pipelined, fixed-size chunks and hashed locally.
+
+        Arguments:
+            remote_file_path (:obj:`str`): path of the remote file
+
+        Returns:
+            :obj:`str`: hexadecimal checksum, None if it could not be obtained
+
+        '''
+        command = REMOTE_HASH_COMMANDS.get(self.hash_algorithm)
+        if command:
+            ret, output, error = self.execute_cmd(command+' '+quote(remote_file_path),
+                                                  idempotent=True)
+            if ret:
+                return output.split(' ')[0]
+        try:
+            remote_file_obj = self.get_sftp_client().open(remote_file_path, 'rb')
+            try:
+                remote_file_obj.prefetch()
+                return hash_file_object(remote_file_obj, self.hash_algorithm,
+                                        self.hash_chunk_size)
+            finally:
+                remote_file_obj.close()
+        except Exception as error:
+            self.log.warning('It was not possible to obtain '+self.hash_algorithm
+                             +' of remote file '+remote_file_path+': '+str(error))
+        return None
+
+    def put_file(self, local_file_path, remote_file_path, callback=None, report_stats=False):
         '''
         Transfers a local file to a remote file
 
@@ -240,20 +900,41 @@ class RemoteServer(Loggers):
             remote_file_path (:obj:`str`): path of the remote file
             callback (:obj:`callback`): callback that reports file transfer status
                 (bytes transfered and total bytes) _default: None
+            report_stats (:obj:`bool`): if True, the callback also receives a dict with the
+                compression ratio and the effective throughput _default: False
 
         Returns:
             :obj:`bool`: *True* if successfully transfered, *False* otherwise
         '''
-        if self.server:
-            self.log.debug('Transfering local file '+local_file_path+' to remote file '
-                           +remote_file_path+' in server '+self.server)
-            self.sftp_client.put(local_file_path, remote_file_path, callback)
-            return self.validate_files(local_file_path, remote_file_path)
+        if self.ensure_connected():
+            # the whole file is transfered again if the connection is lost meanwhile
+            return self.call_with_retries(self._put_file, local_file_path, remote_file_path,
+                                          callback, report_stats)
         else:
             self.log.error('No connection with any server is active now.')
             return False
 
-    def get_file(self, local_file_path, remote_file_path, callback=None):
+    def _put_file(self, local_file_path, remote_file_path, callback, report_stats):
+        '''Transfers a local file to a remote file over the active connection'''
+        self.log.debug('Transfering local file '+local_file_path+' to remote file '
+                       +remote_file_path+' in server '+self.server)
+        # the local checksum is computed while the file is read for the transfer
+        with open(local_file_path, 'rb') as local_file:
+            sftp_client = self._transfer_client(local_file.read(COMPRESSION_SAMPLE_SIZE))
+            local_file.seek(0)
+            hashing_file = HashingFile(local_file, self.hash_algorithm)
+            file_size = os.fstat(local_file.fileno()).st_size
+            with self.timed('transfer', direction='put'):
+                sftp_client.putfo(hashing_file, remote_file_path, file_size,
+                                  self._transfer_callback(callback, report_stats))
+        self.record_metric('ssh_paramiko_transfer_bytes', file_size, direction='put')
+        start = time.time()
+        checksum_remote = self.remote_checksum(remote_file_path)
+        return self.compare_checksums(local_file_path, remote_file_path,
+                                      hashing_file.hexdigest(), checksum_remote,
+                                      hashing_file.hash_time, time.time() - start)
+
+    def get_file(self, local_file_path, remote_file_path, callback=None, report_stats=False):
         '''
         Transfers a remote file to a local file
 
@@ -262,20 +943,1031 @@ class RemoteServer(Loggers):
             remote_file_path (:obj:`str`): path of the remote file
             callback (:obj:`callback`): callback that reports file transfer status
                 (bytes transfered and total bytes) _default: None
+            report_stats (:obj:`bool`): if True, the callback also receives a dict with the
+                compression ratio and the effective throughput _default: False
 
         Returns:
             :obj:`bool`: *True* if successfully transfered, *False* otherwise
 
         '''
-        if self.server:
-            self.log.debug('Transfering remote file '+remote_file_path+' from server '
-                           +self.server+' to local file '+local_file_path)
-            self.sftp_client.get(remote_file_path, local_file_path, callback)
-            return self.validate_files(local_file_path, remote_file_path)
+        if self.ensure_connected():
+            # the whole file is transfered again if the connection is lost meanwhile
+            return self.call_with_retries(self._get_file, local_file_path, remote_file_path,
+                                          callback, report_stats)
         else:
             self.log.error('_no connection with any server is active now.')
             return False
 
+    def _get_file(self, local_file_path, remote_file_path, callback, report_stats):
+        '''Transfers a remote file to a local file over the active connection'''
+        self.log.debug('Transfering remote file '+remote_file_path+' from server '
+                       +self.server+' to local file '+local_file_path)
+        # the remote checksum is computed while the file is transfered, and the local one
+        # while it is written
+        remote_hash = {}
+
+        def hash_remote_file():
+            start = time.time()
+            remote_hash['checksum'] = self.remote_checksum(remote_file_path)
+            remote_hash['time'] = time.time() - start
+        hash_thread = threading.Thread(target=hash_remote_file)
+        hash_thread.daemon = True
+        hash_thread.start()
+        sample = b''
+        if self.compression == 'auto':
+            with self.get_sftp_client().open(remote_file_path, 'rb') as remote_file:
+                sample = remote_file.read(COMPRESSION_SAMPLE_SIZE)
+        sftp_client = self._transfer_client(sample)
+        with open(local_file_path, 'wb') as local_file:
+            hashing_file = HashingFile(local_file, self.hash_algorithm)
+            with self.timed('transfer', direction='get'):
+                file_size = sftp_client.getfo(remote_file_path, hashing_file,
+                                              self._transfer_callback(callback,
+                                                                      report_stats),
+                                              **self._prefetch_args())
+        self.record_metric('ssh_paramiko_transfer_bytes', file_size, direction='get')
+        hash_thread.join()
+        return self.compare_checksums(local_file_path, remote_file_path,
+                                      hashing_file.hexdigest(), remote_hash.get('checksum'),
+                                      hashing_file.hash_time, remote_hash.get('time', 0))
+
+    def put_file_chunked(self, local_file_path, remote_file_path, callback=None,
+                         chunk_size=CHUNKED_TRANSFER_SIZE, workers=4):
+        '''
+        Transfers a large local file to a remote file in parallel, resumable chunks
+
+        The file is split in chunks of *chunk_size* bytes which are written at their offsets
+        by *workers* simultaneous sftp channels. Each chunk is verified against its checksum
+        computed in the remote server (or read back through sftp if the server lacks the
+        hash command) and recorded in a manifest next to the local file
+        (*local_file_path*.part.json), so an interrupted transfer resumes from the chunks
+        already verified.
+
+        Arguments:
+            local_file_path (:obj:`str`): path of the local file
+            remote_file_path (:obj:`str`): path of the remote file
+            callback (:obj:`callback`): callback that reports file transfer status
+                (bytes transfered and total bytes) _default: None
+            chunk_size (:obj:`int`): size of each chunk (default: 16 MB)
+            workers (:obj:`int`): number of simultaneous chunk transfers (default: 4)
+
+        Returns:
+            :obj:`bool`: *True* if successfully transfered, *False* otherwise
+
+        '''
+        return self._transfer_chunks('put', local_file_path, remote_file_path, callback,
+                                     chunk_size, workers)
+
+    def get_file_chunked(self, local_file_path, remote_file_path, callback=None,
+                         chunk_size=CHUNKED_TRANSFER_SIZE, workers=4):
+        '''
+        Transfers a large remote file to a local file in parallel, resumable chunks
+
+        The file is split in chunks of *chunk_size* bytes which are read at their offsets by
+        *workers* simultaneous sftp channels. Each chunk is verified against its checksum
+        computed in the remote server (or read back through sftp if the server lacks the
+        hash command) and recorded in a manifest next to the local file
+        (*local_file_path*.part.json), so an interrupted transfer resumes from the chunks
+        already verified.
+
+        Arguments:
+            local_file_path (:obj:`str`): path of the local file
+            remote_file_path (:obj:`str`): path of the remote file
+            callback (:obj:`callback`): callback that reports file transfer status
+                (bytes transfered and total bytes) _default: None
+            chunk_size (:obj:`int`): size of each chunk (default: 16 MB)
+            workers (:obj:`int`): number of simultaneous chunk transfers (default: 4)
+
+        Returns:
+            :obj:`bool`: *True* if successfully transfered, *False* otherwise
+
+        '''
+        return self._transfer_chunks('get', local_file_path, remote_file_path, callback,
+                                     chunk_size, workers)
+
+    def remote_chunk_checksums(self, remote_file_path, chunk_size, indexes):
+        '''Obtains the checksums of some chunks of a remote file with a single remote command
+
+        Arguments:
+            remote_file_path (:obj:`str`): path of the remote file
+            chunk_size (:obj:`int`): size of each chunk
+            indexes (:obj:`list`): indexes of the chunks
+
+        Returns:
+            :obj:`dict`: checksum of each chunk index, empty if they could not be obtained
+
+        '''
+        command = REMOTE_HASH_COMMANDS.get(self.hash_algorithm)
+        if not command or not indexes:
+            return {}
+        ret, output, error = self.execute_cmd(
+            'for i in '+' '.join(str(index) for index in indexes)+'; do dd if='
+            +quote(remote_file_path)+' bs='+str(chunk_size)+' skip=$i count=1 2>/dev/null | '
+            +command+'; done')
+        checksums = [line.split(' ')[0] for line in output.splitlines()]
+        if not ret or len(checksums) != len(indexes):
+            self.log.error('Error while obtaining chunk checksums of remote file '
+                           +remote_file_path+': '+error)
+            return {}
+        return dict(zip(indexes, checksums))
+
+    def remote_hash_available(self):
+        '''Checks if the remote server has a working command for *hash_algorithm*
+
+        Returns:
+            :obj:`bool`: *True* if checksums can be computed in the remote server, *False*
+            otherwise
+
+        '''
+        command = REMOTE_HASH_COMMANDS.get(self.hash_algorithm)
+        return bool(command) and self.execute_cmd(command+' </dev/null', idempotent=True)[0]
+
+    def sftp_chunk_checksum(self, sftp_client, remote_file_path, offset, length):
+        '''Obtains the checksum of a range of a remote file read through sftp
+
+        Arguments:
+            sftp_client (:obj:`paramiko.SFTPClient`): sftp client
+            remote_file_path (:obj:`str`): path of the remote file
+            offset (:obj:`int`): start of the range
+            length (:obj:`int`): size of the range
+
+        Returns:
+            :obj:`str`: hexadecimal checksum
+
+        '''
+        digest = new_hash(self.hash_algorithm)
+        pieces = [(position, min(CHUNK_SIZE, offset + length - position))
+                  for position in range(offset, offset + length, CHUNK_SIZE)]
+        with sftp_client.open(remote_file_path, 'rb') as remote_file:
+            for data in remote_file.readv(pieces, **self._prefetch_args()):
+                digest.update(data)
+        return digest.hexdigest()
+
+    def _transfer_chunks(self, direction, local_file_path, remote_file_path, callback,
+                         chunk_size, workers):
+        '''Transfers a file in parallel, resumable and verified chunks
+
+        Arguments:
+            direction (:obj:`str`): *put* or *get*
+
+        '''
+        if not self.server:
+            self.log.error('No connection with any server is active now.')
+            return False
+        sftp_client = self.get_sftp_client()
+        if direction == 'put':
+            local_stat = os.stat(local_file_path)
+            size, mtime = local_stat.st_size, int(local_stat.st_mtime)
+        else:
+            remote_stat = sftp_client.stat(remote_file_path)
+            size, mtime = remote_stat.st_size, remote_stat.st_mtime
+        manifest_path = local_file_path+'.part.json'
+        manifest = {
+            'direction': direction,
+            'remote_file_path': remote_file_path,
+            'size': size,
+            'mtime': mtime,
+            'chunk_size': chunk_size,
+            'algorithm': self.hash_algorithm,
+            'chunks': {}
+            }
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as manifest_file:
+                previous = json.load(manifest_file)
+            if dict(previous, chunks={}) == manifest:
+                manifest = previous
+                self.log.info('Resuming transfer of '+local_file_path+' from '
+                              +str(len(manifest['chunks']))+' verified chunks')
+        indexes = [index for index in range((size + chunk_size - 1) // chunk_size)
+                   if str(index) not in manifest['chunks']]
+        self.log.debug('Transfering '+str(len(indexes))+' chunks of file '+local_file_path
+                       +' ('+direction+') in server '+self.server)
+        if direction == 'put':
+            remote_checksums = {}
+            remote_hashing = not indexes or self.remote_hash_available()
+            if not manifest['chunks']:
+                with sftp_client.open(remote_file_path, 'wb') as remote_file:
+                    remote_file.truncate(size)
+        else:
+            remote_checksums = self.remote_chunk_checksums(remote_file_path, chunk_size,
+                                                           indexes)
+            remote_hashing = not indexes or bool(remote_checksums)
+            if not os.path.exists(local_file_path) or not manifest['chunks']:
+                with open(local_file_path, 'wb') as local_file:
+                    local_file.truncate(size)
+        if not remote_hashing:
+            # checked before moving any data, or every chunk would fail its verification
+            self.log.warning('The '+self.hash_algorithm+' checksums of the chunks can\'t be'
+                             ' computed in server '+self.server+'; each chunk is read again'
+                             ' through sftp to verify it')
+        jobs = Queue()
+        for index in indexes:
+            jobs.put(index)
+        lock = threading.Lock()
+        progress = [size - sum(min(chunk_size, size - index * chunk_size) for index in indexes)]
+        failed = []
+
+        def transfer_chunk(worker_sftp, local_file, index):
+            offset = index * chunk_size
+            length = min(chunk_size, size - offset)
+            digest = new_hash(self.hash_algorithm)
+            local_file.seek(offset)
+            if direction == 'put':
+                # the writes are pipelined: closing the remote file waits until the server
+                # has acknowledged all of them, so the chunk is complete when it is hashed
+                with worker_sftp.open(remote_file_path, 'r+b') as remote_file:
+                    remote_file.set_pipelined(True)
+                    remote_file.seek(offset)
+                    for position in range(offset, offset + length, CHUNK_SIZE):
+                        data = local_file.read(min(CHUNK_SIZE, offset + length - position))
+                        digest.update(data)
+                        remote_file.write(data)
+                if remote_hashing:
+                    checksum_remote = self.remote_chunk_checksums(remote_file_path, chunk_size,
+                                                                  [index]).get(index)
+                else:
+                    checksum_remote = self.sftp_chunk_checksum(worker_sftp, remote_file_path,
+                                                               offset, length)
+            else:
+                pieces = [(position, min(CHUNK_SIZE, offset + length - position))
+                          for position in range(offset, offset + length, CHUNK_SIZE)]
+                with worker_sftp.open(remote_file_path, 'rb') as remote_file:
+                    for data in remote_file.readv(pieces, **self._prefetch_args()):
+                        digest.update(data)
+                        local_file.write(data)
+                local_file.flush()
+                if remote_hashing:
+                    checksum_remote = remote_checksums.get(index)
+                else:
+                    checksum_remote = self.sftp_chunk_checksum(worker_sftp, remote_file_path,
+                                                               offset, length)
+            if digest.hexdigest() != checksum_remote:
+                raise IOError('checksum of chunk '+str(index)+' does not match')
+            with lock:
+                manifest['chunks'][str(index)] = checksum_remote
+                with open(manifest_path, 'w') as manifest_file:
+                    json.dump(manifest, manifest_file)
+                progress[0] += length
+                if callback:
+                    callback(progress[0], size)
+
+        def worker():
+            worker_sftp = self.open_sftp(self.sftp_transport or self.transport)
+            local_file = open(local_file_path, 'rb' if direction == 'put' else 'r+b')
+            try:
+                while True:
+                    try:
+                        index = jobs.get_nowait()
+                    except Empty:
+                        return
+                    try:
+                        transfer_chunk(worker_sftp, local_file, index)
+                    except (IOError, OSError, paramiko.SSHException, socket.error) as error:
+                        self.log.error('Error while transfering chunk '+str(index)+' of file '
+                                       +local_file_path+': '+str(error))
+                        failed.append(index)
+            finally:
+                local_file.close()
+                worker_sftp.close()
+        threads = [threading.Thread(target=worker) for _ in range(min(workers, len(indexes)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if failed:
+            self.log.error(str(len(failed))+' chunks of file '+local_file_path+' failed; the'
+                           ' transfer can be resumed')
+            return False
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        return True
+
+    def put_tree(self, local_dir, remote_dir, workers=4, callback=None, batch_size=200):
+        '''
+        Transfers a local directory tree to a remote directory
+
+        Remote directories are created in batches, files are transfered in parallel over
+        *workers* sftp channels and their checksums are verified in batches of *batch_size*
+        files per remote command.
+
+        Arguments:
+            local_dir (:obj:`str`): path of the local directory
+            remote_dir (:obj:`str`): path of the remote directory
+            workers (:obj:`int`): number of simultaneous transfers (default: 4)
+            callback (:obj:`callback`): callback that reports each file transfer status
+                (local file path, bytes transfered and total bytes) _default: None
+            batch_size (:obj:`int`): number of paths handled by each remote command
+                (default: 200)
+
+        Returns:
+            ret (:obj:`bool`): *True* if all files were successfully transfered, *False*
+                otherwise
+        Returns:
+            report (:obj:`dict`): number of files, bytes, seconds, throughput (bytes per
+                second) and list of failed local files
+
+        '''
+        if not self.server:
+            self.log.error('No connection with any server is active now.')
+            return False, {}
+        files, remote_dirs = self._local_tree(local_dir, remote_dir)
+        self.log.debug('Transfering local tree '+local_dir+' ('+str(len(files))
+                       +' files) to remote directory '+remote_dir+' in server '+self.server)
+        if not self._make_remote_dirs(remote_dirs, batch_size):
+            return False, {}
+        return self.transfer_files(files, self._put_transfer, workers, callback, batch_size)
+
+    def get_tree(self, local_dir, remote_dir, workers=4, callback=None, batch_size=200):
+        '''
+        Transfers a remote directory tree to a local directory
+
+        Files are transfered in parallel over *workers* sftp channels and their checksums are
+        verified in batches of *batch_size* files per remote command.
+
+        Arguments:
+            local_dir (:obj:`str`): path of the local directory
+            remote_dir (:obj:`str`): path of the remote directory
+            workers (:obj:`int`): number of simultaneous transfers (default: 4)
+            callback (:obj:`callback`): callback that reports each file transfer status
+                (local file path, bytes transfered and total bytes) _default: None
+            batch_size (:obj:`int`): number of paths handled by each remote command
+                (default: 200)
+
+        Returns:
+            ret (:obj:`bool`): *True* if all files were successfully transfered, *False*
+                otherwise
+        Returns:
+            report (:obj:`dict`): number of files, bytes, seconds, throughput (bytes per
+                second) and list of failed local files
+
+        '''
+        if not self.server:
+            self.log.error('No connection with any server is active now.')
+            return False, {}
+        files, local_dirs, _ = self._remote_tree(remote_dir, local_dir)
+        self.log.debug('Transfering remote tree '+remote_dir+' ('+str(len(files))
+                       +' files) from server '+self.server+' to local directory '+local_dir)
+        for path in local_dirs:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        return self.transfer_files(files, self._get_transfer, workers, callback, batch_size)
+
+    def sync(self, local_dir, remote_dir, delta=True, block_size=65536, workers=4,
+             callback=None, batch_size=200):
+        '''
+        Synchronizes a local directory tree to a remote directory, sending only changes
+
+        Files with the same size and modification time in both sides are skipped; files with
+        the same size but another modification time are compared by checksum. With *delta*,
+        changed files that already exist in the remote server are patched in place: only the
+        blocks whose checksum, computed in the remote server, differs are sent.
+
+        Arguments:
+            local_dir (:obj:`str`): path of the local directory
+            remote_dir (:obj:`str`): path of the remote directory
+            delta (:obj:`bool`): if False, changed files are always sent whole (default: True)
+            block_size (:obj:`int`): size of the blocks compared by the delta transfer
+                (default: 65536)
+            workers (:obj:`int`): number of simultaneous transfers (default: 4)
+            callback (:obj:`callback`): callback that reports each whole file transfer
+                status (local file path, bytes transfered and total bytes) _default: None
+            batch_size (:obj:`int`): number of paths handled by each remote command
+                (default: 200)
+
+        Returns:
+            ret (:obj:`bool`): *True* if the remote tree was successfully synchronized,
+                *False* otherwise
+        Returns:
+            report (:obj:`dict`): number of files, transfered (whole), patched and skipped
+                files, bytes, bytes_sent, bytes_saved, seconds and list of failed local files
+
+        '''
+        if not self.server:
+            self.log.error('No connection with any server is active now.')
+            return False, {}
+        start = time.time()
+        files, remote_dirs = self._local_tree(local_dir, remote_dir)
+        try:
+            remote_attrs = self._remote_tree(remote_dir, local_dir)[2]
+        except IOError:
+            remote_attrs = {}
+        unchanged, candidates, changed = [], [], []
+        for local_path, remote_path in files:
+            local_stat = os.stat(local_path)
+            attr = remote_attrs.get(remote_path)
+            if attr is None or attr.st_size != local_stat.st_size:
+                changed.append((local_path, remote_path))
+            elif attr.st_mtime == int(local_stat.st_mtime):
+                unchanged.append((local_path, remote_path))
+            else:
+                candidates.append((local_path, remote_path))
+        for index in range(0, len(candidates), batch_size):
+            batch = candidates[index:index + batch_size]
+            remote_checksums = self.remote_checksums([path for _, path in batch])
+            for local_path, remote_path in batch:
+                if remote_checksums.get(remote_path) == hash_local_file(
+                        local_path, self.hash_algorithm, self.hash_chunk_size):
+                    unchanged.append((local_path, remote_path))
+                    # only the modification time differs: fix it so it is skipped next time
+                    self._copy_mtime(local_path, remote_path)
+                else:
+                    changed.append((local_path, remote_path))
+        if not self._make_remote_dirs(remote_dirs, batch_size):
+            return False, {}
+        whole, patched = [], []
+        bytes_sent = 0
+        for local_path, remote_path in changed:
+            if delta and remote_path in remote_attrs:
+                sent = self.patch_file(local_path, remote_path, block_size)
+                if sent is not None:
+                    bytes_sent += sent
+                    patched.append((local_path, remote_path))
+                    continue
+            whole.append((local_path, remote_path))
+        ret, report = self.transfer_files(whole, self._put_transfer, workers, callback,
+                                          batch_size)
+        failed = report['failed']
+        bytes_sent += report['bytes']
+        for index in range(0, len(patched), batch_size):
+            batch = patched[index:index + batch_size]
+            remote_checksums = self.remote_checksums([path for _, path in batch])
+            for local_path, remote_path in batch:
+                if remote_checksums.get(remote_path) != hash_local_file(
+                        local_path, self.hash_algorithm, self.hash_chunk_size):
+                    self.log.error('Error: patched remote file '+remote_path
+                                   +' is not the same as local file '+local_path)
+                    failed.append(local_path)
+        for local_path, remote_path in whole + patched:
+            if local_path not in failed:
+                self._copy_mtime(local_path, remote_path)
+        total_bytes = sum(os.path.getsize(local_path) for local_path, _ in files)
+        report = {
+            'files': len(files),
+            'transfered': len(whole),
+            'patched': len(patched),
+            'skipped': len(unchanged),
+            'bytes': total_bytes,
+            'bytes_sent': bytes_sent,
+            'bytes_saved': total_bytes - bytes_sent,
+            'seconds': time.time() - start,
+            'failed': failed
+            }
+        self.log.info('Synchronized '+local_dir+' to '+remote_dir+' in server '+self.server
+                      +': '+str(len(whole))+' files sent, '+str(len(patched))+' patched, '
+                      +str(len(unchanged))+' unchanged, '+str(report['bytes_saved'])
+                      +' bytes saved')
+        return not failed, report
+
+    def patch_file(self, local_file_path, remote_file_path, block_size=65536):
+        '''Updates a remote file in place, sending only the blocks that differ
+
+        The md5 of each block of the remote file is computed in the remote server, which
+        must have a python interpreter.
+
+        Arguments:
+            local_file_path (:obj:`str`): path of the local file
+            remote_file_path (:obj:`str`): path of the remote file
+            block_size (:obj:`int`): size of the compared blocks (default: 65536)
+
+        Returns:
+            :obj:`int`: number of bytes sent, None if the remote block checksums could not be
+            obtained
+
+        '''
+        script = ("import hashlib, sys\n"
+                  "remote_file = open(sys.argv[1], 'rb')\n"
+                  "while True:\n"
+                  "    block = remote_file.read("+str(block_size)+")\n"
+                  "    if not block:\n"
+                  "        break\n"
+                  "    print(hashlib.md5(block).hexdigest())\n")
+        ret, output, error = self.execute_cmd(
+            'for python in python3 python; do command -v $python >/dev/null 2>&1 && exec '
+            '$python -c '+quote(script)+' '+quote(remote_file_path)+'; done; exit 127')
+        if not ret:
+            self.log.debug('Block checksums of remote file '+remote_file_path
+                           +' are not available, sending it whole')
+            return None
+        remote_blocks = output.split()
+        sent = 0
+        with open(local_file_path, 'rb') as local_file:
+            remote_file = self.get_sftp_client().open(remote_file_path, 'r+b')
+            try:
+                remote_file.set_pipelined(True)
+                index = 0
+                while True:
+                    block = local_file.read(block_size)
+                    if not block:
+                        break
+                    if index >= len(remote_blocks) or \
+                       hash_bytes(block, 'md5') != remote_blocks[index]:
+                        remote_file.seek(index * block_size)
+                        remote_file.write(block)
+                        sent += len(block)
+                    index += 1
+                remote_file.truncate(os.fstat(local_file.fileno()).st_size)
+            finally:
+                remote_file.close()
+        return sent
+
+    def _local_tree(self, local_dir, remote_dir):
+        '''Lists the files and directories of a local tree with their remote paths
+
+        Returns:
+            :obj:`tuple`: list of pairs of local and remote file paths, and list of remote
+            directories
+
+        '''
+        files = []
+        remote_dirs = [remote_dir]
+        for root, dirs, names in os.walk(local_dir):
+            rel_root = os.path.relpath(root, local_dir)
+            remote_root = remote_dir if rel_root == os.curdir else \
+                posixpath.join(remote_dir, *rel_root.split(os.sep))
+            remote_dirs.extend(posixpath.join(remote_root, name) for name in dirs)
+            files.extend((os.path.join(root, name), posixpath.join(remote_root, name))
+                         for name in names)
+        return files, remote_dirs
+
+    def _remote_tree(self, remote_dir, local_dir):
+        '''Lists the files and directories of a remote tree with their local paths
+
+        Returns:
+            :obj:`tuple`: list of pairs of local and remote file paths, list of local
+            directories and sftp attributes of each remote file path
+
+        '''
+        sftp_client = self.get_sftp_client()
+        files = []
+        local_dirs = [local_dir]
+        attrs = {}
+        pending = [(remote_dir, local_dir)]
+        while pending:
+            remote_root, local_root = pending.pop()
+            for attr in sftp_client.listdir_attr(remote_root):
+                remote_path = posixpath.join(remote_root, attr.filename)
+                local_path = os.path.join(local_root, attr.filename)
+                if stat.S_ISDIR(attr.st_mode):
+                    pending.append((remote_path, local_path))
+                    local_dirs.append(local_path)
+                elif stat.S_ISREG(attr.st_mode):
+                    files.append((local_path, remote_path))
+                    attrs[remote_path] = attr
+        return files, local_dirs, attrs
+
+    def _make_remote_dirs(self, remote_dirs, batch_size=200):
+        '''Creates remote directories with one command per batch of *batch_size* paths'''
+        for index in range(0, len(remote_dirs), batch_size):
+            batch = remote_dirs[index:index + batch_size]
+            ret, output, error = self.execute_cmd('mkdir -p '+' '.join(quote(path)
+                                                                      for path in batch))
+            if not ret:
+                return False
+        return True
+
+    def _copy_mtime(self, local_file_path, remote_file_path):
+        '''Sets the access and modification times of a remote file to the local file ones'''
+        local_stat = os.stat(local_file_path)
+        self.get_sftp_client().utime(remote_file_path, (local_stat.st_atime,
+                                                        local_stat.st_mtime))
+
+    def _put_transfer(self, sftp_client, local_path, remote_path, file_callback):
+        '''Uploads a file for :meth:`transfer_files`, returning its local checksum'''
+        with open(local_path, 'rb') as local_file:
+            hashing_file = HashingFile(local_file, self.hash_algorithm)
+            sftp_client.putfo(hashing_file, remote_path, os.fstat(local_file.fileno()).st_size,
+                              file_callback)
+        return hashing_file.hexdigest()
+
+    def _get_transfer(self, sftp_client, local_path, remote_path, file_callback):
+        '''Downloads a file for :meth:`transfer_files`, returning its local checksum'''
+        with open(local_path, 'wb') as local_file:
+            hashing_file = HashingFile(local_file, self.hash_algorithm)
+            sftp_client.getfo(remote_path, hashing_file, file_callback, **self._prefetch_args())
+        return hashing_file.hexdigest()
+
+    def transfer_files(self, files, transfer, workers=4, callback=None, batch_size=200):
+        '''Transfers many files in parallel sftp channels and verifies them in batches
+
+        Arguments:
+            files (:obj:`list`): pairs of local and remote file paths
+            transfer (:obj:`callable`): transfers one file; called with a sftp client, the
+                local path, the remote path and a paramiko progress callback, it returns the
+                checksum of the local file
+            workers (:obj:`int`): number of simultaneous transfers (default: 4)
+            callback (:obj:`callback`): callback that reports each file transfer status
+                (local file path, bytes transfered and total bytes) _default: None
+            batch_size (:obj:`int`): number of files verified by each remote command
+                (default: 200)
+
+        Returns:
+            ret (:obj:`bool`): *True* if all files were successfully transfered, *False*
+                otherwise
+        Returns:
+            report (:obj:`dict`): number of files, bytes, seconds, throughput (bytes per
+                second) and list of failed local files
+
+        '''
+        start = time.time()
+        jobs = Queue()
+        for paths in files:
+            jobs.put(paths)
+        checksums = {}
+        failed = []
+
+        def worker():
+            sftp_client = self.open_sftp(self.sftp_transport or self.transport)
+            try:
+                while True:
+                    try:
+                        local_path, remote_path = jobs.get_nowait()
+                    except Empty:
+                        return
+                    file_callback = None
+                    if callback:
+                        file_callback = lambda done, total, path=local_path: \
+                            callback(path, done, total)
+                    try:
+                        checksums[remote_path] = (local_path, transfer(
+                            sftp_client, local_path, remote_path, file_callback))
+                    except (IOError, OSError, paramiko.SSHException, socket.error) as error:
+                        self.log.error('Error while transfering file '+local_path+': '
+                                       +str(error))
+                        failed.append(local_path)
+            finally:
+                sftp_client.close()
+        threads = [threading.Thread(target=worker) for _ in range(min(workers, len(files)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        remote_paths = list(checksums)
+        for index in range(0, len(remote_paths), batch_size):
+            batch = remote_paths[index:index + batch_size]
+            remote_checksums = self.remote_checksums(batch)
+            for remote_path in batch:
+                local_path, checksum_local = checksums[remote_path]
+                if remote_checksums.get(remote_path) != checksum_local:
+                    self.log.error('Error: '+self.hash_algorithm+' of remote file '+remote_path
+                                   +' is not the same as the one of local file '+local_path)
+                    failed.append(local_path)
+        elapsed = time.time() - start
+        total_bytes = sum(os.path.getsize(local_path) for local_path, _ in checksums.values())
+        report = {
+            'files': len(files),
+            'bytes': total_bytes,
+            'seconds': elapsed,
+            'throughput': total_bytes / elapsed if elapsed else 0.0,
+            'failed': failed
+            }
+        self.log.info('Transfered '+str(len(files) - len(failed))+' of '+str(len(files))
+                      +' files ('+str(total_bytes)+' bytes) in '+str(round(elapsed, 2))
+                      +' seconds: '+str(round(report['throughput'] / pow(2, 20), 2))+' MB/s')
+        return not failed, report
+
+    def remote_checksums(self, remote_file_paths):
+        '''Obtains the checksums of many remote files with a single remote command
+
+        Arguments:
+            remote_file_paths (:obj:`list`): paths of the remote files
+
+        Returns:
+            :obj:`dict`: checksum of each remote file path (files whose checksum could not
+            be obtained are missing)
+
+        '''
+        command = REMOTE_HASH_COMMANDS.get(self.hash_algorithm)
+        if not command:
+            checksums = dict((path, self.remote_checksum(path)) for path in remote_file_paths)
+            return dict((path, checksum) for path, checksum in checksums.items() if checksum)
+        checksums = {}
+        # the output is parsed even if some files failed, so the return code is ignored
+        ret, output, error = self.execute_cmd(command+' '+' '.join(quote(path) for path
+                                                                   in remote_file_paths),
+                                              idempotent=True)
+        for line in output.splitlines():
+            if ' ' not in line:
+                continue
+            checksum, path = line.split(' ', 1)
+            path = path[1:]
+            if checksum.startswith('\\'):
+                # names with newlines or backslashes are escaped by the *sum commands
+                checksum = checksum[1:]
+                path = path.replace('\\n', '\n').replace('\\\\', '\\')
+            checksums[path] = checksum
+        return checksums
+
+    def _transfer_client(self, sample):
+        '''Chooses the sftp client of a transfer, given a sample of the file beginning
+
+        With *compression* set to auto, content that compresses well is routed over a
+        dedicated compressed transport, and anything else over the regular one.
+
+        Arguments:
+            sample (:obj:`bytes`): first bytes of the transfered file
+
+        Returns:
+            :obj:`paramiko.SFTPClient`: sftp client
+
+        '''
+        ratio = compression_ratio(sample) if sample and self.compression else 1.0
+        compressed = self.compression is True or (self.compression == 'auto' and
+                                                  ratio >= AUTO_COMPRESSION_RATIO)
+        self.last_transfer = {
+            'compressed': compressed,
+            'compression_ratio': ratio if compressed else 1.0,
+            'start': time.time()
+            }
+        if self.compression == 'auto' and compressed:
+            if self.compressed_sftp_client is None:
+                self.log.debug('Instantiating compressed transport object for sftp...')
+                transport = paramiko.Transport(self.open_server_socket(),
+                                               **self._window_args('default_'))
+                transport.use_compression(True)
+                self.authenticate_transport(transport)
+                self.compressed_sftp_transport = transport
+                self.compressed_sftp_client = self.open_sftp(transport)
+            return self.compressed_sftp_client
+        return self.get_sftp_client()
+
+    def _transfer_callback(self, callback, report_stats):
+        '''Wraps a transfer callback to keep *last_transfer* up to date
+
+        Arguments:
+            callback (:obj:`callback`): user callback, None if there is none
+            report_stats (:obj:`bool`): if True, the user callback also receives
+                *last_transfer*
+
+        Returns:
+            :obj:`callback`: paramiko transfer callback
+
+        '''
+        def report(transfered_bytes, total_bytes):
+            elapsed = time.time() - self.last_transfer['start']
+            self.last_transfer['bytes'] = transfered_bytes
+            self.last_transfer['throughput'] = transfered_bytes / elapsed if elapsed else 0.0
+            if callback and report_stats:
+                callback(transfered_bytes, total_bytes, self.last_transfer)
+            elif callback:
+                callback(transfered_bytes, total_bytes)
+        return report
+
+    def authenticate_transport(self, transport):
+        '''Negotiates a new transport, checks the server host key and authenticates it
+
+        The host key is checked against *known_hosts*. The private key, the agent keys (with
+        *use_agent*) and the password are tried in this order until one is accepted.
+
+        Arguments:
+            transport (:obj:`paramiko.Transport`): transport not started yet
+
+        Raises:
+            :obj:`paramiko.BadHostKeyException`: if the server host key is not the known one
+            :obj:`paramiko.AuthenticationException`: if no credential is accepted
+
+        '''
+        transport.start_client(timeout=self.ssh_time_out)
+        self.host_key_policy.verify(host_key_name(self.server, self.ssh_port),
+                                    transport.get_remote_server_key())
+        keys = [self.private_key] if self.private_key else []
+        for key in keys + (agent_keys() if self.use_agent else []):
+            try:
+                transport.auth_publickey(self.username, key)
+                return
+            except paramiko.AuthenticationException:
+                continue
+        if self.password:
+            transport.auth_password(self.username, self.password)
+            return
+        raise paramiko.AuthenticationException('No private key, agent key or password was'
+                                               ' accepted by server '+str(self.server))
+
+    def get_sftp_client(self):
+        '''Returns the sftp client of the current connection
+
+        When *sftp_shared_transport* is set, the sftp subsystem is opened as a channel over
+        the existing ssh transport the first time this method is called.
+
+        Returns:
+            :obj:`paramiko.SFTPClient`: sftp client, or None if sftp is not available
+
+        '''
+        if self.sftp_client is None and self.sftp_support and self.sftp_shared_transport \
+           and self.transport:
+            self.log.debug('Opening sftp channel over the ssh transport...')
+            self.sftp_client = self.open_sftp(self.transport)
+        return self.sftp_client
+
+    def open_server_socket(self):
+        '''Opens a tcp connection to the ssh port of the current server
+
+        The address resolved by connect_server is used, so the server name is not resolved
+        again for each transport.
+
+        Returns:
+            :obj:`socket.socket`: connected socket
+
+        '''
+        with self.timed('tcp_connect'):
+            if self.address:
+                return open_socket(self.address, self.ssh_time_out)
+            return socket.create_connection((self.server, self.ssh_port), self.ssh_time_out)
+
+    def open_sftp(self, transport):
+        '''Opens a sftp client over a transport, with the window and packet sizes set
+
+        Arguments:
+            transport (:obj:`paramiko.Transport`): authenticated transport
+
+        Returns:
+            :obj:`paramiko.SFTPClient`: sftp client
+
+        '''
+        with self.timed('sftp_init'):
+            return paramiko.SFTPClient.from_transport(transport, **self._window_args())
+
+    def _window_args(self, prefix=''):
+        '''Keyword arguments with the configured window and packet sizes, if any'''
+        window_args = {}
+        if self.window_size:
+            window_args[prefix+'window_size'] = self.window_size
+        if self.max_packet_size:
+            window_args[prefix+'max_packet_size'] = self.max_packet_size
+        return window_args
+
+    def _prefetch_args(self):
+        '''Keyword arguments with the configured sftp prefetch depth, if any'''
+        if self.prefetch_depth:
+            return {'max_concurrent_prefetch_requests': self.prefetch_depth}
+        return {}
+
+    def close_sftp(self):
+        '''
+        Closes the sftp clients and their dedicated transports, if any
+
+        '''
+        for sftp_client in (self.sftp_client, self.compressed_sftp_client):
+            if sftp_client:
+                sftp_client.close()
+        for transport in (self.sftp_transport, self.compressed_sftp_transport):
+            if transport:
+                transport.close()
+        self.sftp_client = None
+        self.sftp_transport = None
+        self.compressed_sftp_client = None
+        self.compressed_sftp_transport = None
+
+    def is_connected(self):
+        '''Checks if the ssh transport and the sftp transports of the connection are active
+
+        A transport stops being active when its socket is closed or fails, which includes
+        the keep-alive packets (see *keepalive*) that could not be sent.
+
+        Returns:
+            :obj:`bool`: *True* if all the transports are active, *False* otherwise
+
+        '''
+        if not self.server or not self.transport:
+            return False
+        if self.sftp_support and not self.sftp_shared_transport and not self.sftp_transport:
+            return False
+        return all(transport.is_active() for transport in
+                   (self.transport, self.sftp_transport, self.compressed_sftp_transport)
+                   if transport)
+
+    def ensure_connected(self):
+        '''Reconnects to the current server if its connection was lost
+
+        Returns:
+            :obj:`bool`: *True* if the connection is active, *False* if there is no server
+            or it could not be reconnected after *retries* attempts
+
+        '''
+        if self.is_connected():
+            return True
+        # connect_server verifies the new connection, which must not reconnect again
+        if not self.server or self.reconnect_thread is threading.current_thread():
+            return False
+        try:
+            return self.call_with_retries(self.is_connected)
+        except (paramiko.SSHException, socket.error, EOFError) as error:
+            self.log.error('Could not reconnect to server '+str(self.server)+': '+str(error))
+            return False
+
+    def reconnect(self):
+        '''Drops the transports of the current connection and connects to the server again
+
+        Concurrent callers wait for the first one, and don't reconnect if it succeeded. The
+        number of reconnections is kept in *reconnect_count*.
+
+        Returns:
+            ret (:obj:`bool`): True if successfully reconnected, False otherwise
+        Returns:
+            msg (:obj:`str`): Message of error if cannot reconnect, empty string otherwise
+
+        '''
+        with self.reconnect_lock:
+            server = self.server
+            if not server:
+                return False, 'No server to reconnect to.'
+            if self.is_connected():
+                return True, ''
+            self.reconnect_count += 1
+            self.log.warning('Reconnecting to server '+str(server)+' (reconnection '
+                             +str(self.reconnect_count)+')...')
+            self.reconnect_thread = threading.current_thread()
+            try:
+                self.drop_connection()
+                with self.timed('reconnect'):
+                    ret, msg = self.connect_server(server, ping=False)
+            finally:
+                self.reconnect_thread = None
+            self.record_metric('ssh_paramiko_reconnects', 1, result='ok' if ret else 'failed')
+            if not ret:
+                # the server is kept, so later operations try to reconnect again
+                self.server = server
+            return ret, msg
+
+    def drop_connection(self):
+        '''
+        Closes the shell, the ssh client and the sftp transports, whatever their state
+
+        '''
+        closers = [self.close_shell, self.close_sftp]
+        if self._ssh_client:
+            closers.append(self._ssh_client.close)
+        for close in closers:
+            try:
+                close()
+            except Exception as error:
+                self.log.debug('Error while closing a lost connection: '+str(error))
+        self.shell = None
+        self.sftp_client = None
+        self.sftp_transport = None
+        self.compressed_sftp_client = None
+        self.compressed_sftp_transport = None
+        self.transport = None
+        self.verified_identity = None
+        self.server = None
+
+    def call_with_retries(self, function, *args):
+        '''Calls an idempotent operation, reconnecting and calling it again after a transport
+        failure
+
+        Failures of an operation whose connection is still active (a command timeout, a
+        missing remote file...) are not retried.
+
+        Arguments:
+            function (:obj:`callable`): operation
+            args: arguments of the operation
+
+        Returns:
+            result of the operation
+
+        Raises:
+            :obj:`paramiko.SSHException`, :obj:`socket.error` or :obj:`EOFError`: the last
+            transport failure, if the connection was lost again after *retries* attempts
+
+        '''
+        delays = self.retry_delays()
+        while True:
+            try:
+                if not self.is_connected():
+                    raise paramiko.SSHException('Connection with server '+str(self.server)
+                                                +' is not active')
+                return function(*args)
+            except (paramiko.SSHException, socket.error, EOFError) as error:
+                if self.is_connected() or not self.server:
+                    raise
+                delay = next(delays, None)
+                if delay is None:
+                    raise
+                self.log.warning('Connection with server '+str(self.server)+' lost: '
+                                 +str(error)+'. Reconnecting in '+'%.2f' % delay+' s...')
+                time.sleep(delay)
+                self.reconnect()
+
+    def retry_delays(self):
+        '''Seconds to wait before each of the *retries* reconnection attempts
+
+        The first attempt is immediate; the next ones wait *retry_backoff* seconds, doubled
+        for each attempt up to *retry_backoff_max*, with a random jitter of up to half the
+        delay so that many clients that lost their connections at once don't reconnect at
+        once.
+
+        Returns:
+            :obj:`generator`: delays, in seconds
+
+        '''
+        for attempt in range(self.retries):
+            if attempt == 0:
+                yield 0.0
+            else:
+                delay = min(self.retry_backoff_max, self.retry_backoff * 2 ** (attempt - 1))
+                yield delay * random.uniform(0.5, 1.0)
+
     def close_connection(self):
         '''
         Closes remote server connection
@@ -284,19 +1976,40 @@ class RemoteServer(Loggers):
             :obj:`bool`: *True* if successfully disconnected, *False* otherwise
 
         '''
-        if (self.execute_cmd('hostname')[0] and \
-           (self.execute_cmd('hostname')[1]).strip('\n\r')[0:4] == self.server)\
-           or not self.server_has_dns:
+        # a lost connection is not reconnected just to close it
+        connected = self.is_connected() and self.verify_server()
+        self.verified_identity = None
+        self.close_shell()
+        if connected:
             self.ssh_client.close()
-            self.sftp_client.close()
+            self.close_sftp()
             self.log.info('Connection with server '+self.server+' ended.')
             self.server = None
             return True
         else:
-            self.log.info('Server '+self.server+' is disconnected.')
-            self.server = None
+            self.log.info('Server '+str(self.server)+' is disconnected.')
+            self.drop_connection()
             return False
 
+    def is_reachable(self, server):
+        '''Checks if a server is reachable before connecting to it
+
+        With *reachability* set to tcp (the default), a non-blocking connection to the ssh
+        port is tried, and its result cached (see :func:`ssh_paramiko.netutils.probe_servers`);
+        with icmp, the server must answer to :meth:`ping_server`.
+
+        Arguments:
+            server (:obj:`str`): remote server
+
+        Returns:
+            :obj:`bool`: True if the server is reachable, False otherwise
+
+        '''
+        with self.timed('reachability', server=server):
+            if self.reachability == 'icmp':
+                return self.ping_server(server)
+            return probe_server(server, self.ssh_port, self.reachability_timeout)
+
     @staticmethod
     def ping_server(server, tries=4):
         '''Connects a host and a server via ssh
@@ -320,7 +2033,7 @@ class RemoteServer(Loggers):
                                          '1', server], stdout=subprocess.PIPE,
                                         stderr=subprocess.PIPE)
                 output, _ = ping.communicate()
-                if re.search('2 packets transmitted, 2 received', output):
+                if re.search('2 packets transmitted, 2 received', to_str(output)):
                     # _server is pinging back
                     return True
             # _server is not pinging back
@@ -328,7 +2041,7 @@ class RemoteServer(Loggers):
         return True if try_ping(0) else try_ping(0.2)
 
     @staticmethod
-    def transfer_progress_bar(transfered_bytes, total_bytes):
+    def transfer_progress_bar(transfered_bytes, total_bytes, stats=None):
         ''' Provides a transfer progress bar
 
         Given a file to be transfered, print a progress bar according to the bytes
@@ -338,6 +2051,9 @@ class RemoteServer(Loggers):
         Arguments:
             transfered_bytes (:obj:`str`, :obj:`int` or :obj:`float`): bytes transfered
             total_bytes (:obj:`int` or :obj:`float`): size of file in bytes
+            stats (:obj:`dict`, optional): transfer statistics given by put_file and get_file
+                when called with *report_stats*; the compression ratio and the throughput
+                are shown
 
         '''
         bar_length = 35
@@ -353,6 +2069,9 @@ class RemoteServer(Loggers):
                       +str(round(float(total_bytes)/pow(2, 20), 2))+" MB)"
             message += " || File transfered. [{0}] {1}%                    \r"\
                        .format(hashes + spaces, round(percent * 100, 2))
+        if stats:
+            message = message.rstrip('\r')+" || Ratio: "+str(round(stats['compression_ratio'], 2))\
+                      +" || "+str(round(stats['throughput']/pow(2, 20), 2))+" MB/s\r"
         sys.stdout.write(message)
         sys.stdout.flush()
 
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+''' Asyncio front-end against the local ssh/sftp server of the benchmarks
+
+Usage::
+
+    $ python -m pytest tests
+
+'''
+import asyncio
+import os
+import sys
+import time
+import unittest
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from ssh_paramiko.aio import AsyncRemoteServer
+from ssh_paramiko.hostkeys import KnownHostsStore
+from server import BenchmarkServer
+
+SESSIONS = 10
+RTT = 0.1
+
+
+class AsyncRemoteServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.bench = BenchmarkServer(rtt=RTT)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bench.close()
+
+    def test_concurrent_commands_keep_the_loop_running(self):
+        # each exec request takes a round trip, which must not be spent in the loop
+        known_hosts = KnownHostsStore()
+        async def run():
+            remote_servers = [AsyncRemoteServer(None, username='benchmark', password='benchmark',
+                                                ssh_port=self.bench.port, server_has_dns=False,
+                                                known_hosts=known_hosts)
+                              for _ in range(SESSIONS)]
+            for ret, msg in await asyncio.gather(*[remote_server.connect_server('127.0.0.1',
+                                                                                ping=False)
+                                                   for remote_server in remote_servers]):
+                self.assertTrue(ret, msg)
+            stalls = []
+            done = asyncio.Event()
+
+            async def tick():
+                last = time.time()
+                while not done.is_set():
+                    await asyncio.sleep(0.01)
+                    stalls.append(time.time() - last)
+                    last = time.time()
+            ticker = asyncio.ensure_future(tick())
+            try:
+                results = await asyncio.gather(*[remote_server.execute_cmd('echo '+str(index))
+                                                 for index, remote_server
+                                                 in enumerate(remote_servers)])
+            finally:
+                done.set()
+                await ticker
+                await asyncio.gather(*[remote_server.close_connection()
+                                       for remote_server in remote_servers])
+            self.assertEqual(results, [(True, str(index)+'\n', '')
+                                       for index in range(SESSIONS)])
+            self.assertLess(max(stalls), RTT)
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
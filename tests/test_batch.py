@@ -0,0 +1,53 @@
+#!/usr/bin/python
+''' Batches of commands against the local ssh/sftp server of the benchmarks
+
+Usage::
+
+    $ python -m pytest tests
+
+'''
+import os
+import sys
+import unittest
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from ssh_paramiko import RemoteServer
+from ssh_paramiko.hostkeys import KnownHostsStore
+from server import BenchmarkServer
+
+
+class BatchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.bench = BenchmarkServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bench.close()
+
+    def setUp(self):
+        self.remote_server = RemoteServer(None, username='benchmark', password='benchmark',
+                                          ssh_port=self.bench.port, server_has_dns=False,
+                                          known_hosts=KnownHostsStore())
+        ret, msg = self.remote_server.connect_server('127.0.0.1', ping=False)
+        self.assertTrue(ret, msg)
+
+    def tearDown(self):
+        self.remote_server.close_connection()
+
+    def test_execute_batch(self):
+        # an exit ends its own command only
+        results = self.remote_server.execute_batch(
+            ['echo a', 'echo b >&2; exit 2', 'cat', 'printf nonl'])
+        self.assertEqual(results, [(True, 'a\n', '', 0), (False, '', 'b\n', 2),
+                                   (True, '', '', 0), (True, 'nonl', '', 0)])
+
+    def test_execute_batch_isolates_commands(self):
+        results = self.remote_server.execute_batch(['cd / && X=1', 'pwd; echo "[$X]"'])
+        self.assertEqual(results[1], (True, os.getcwd()+'\n[]\n', '', 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+''' Chunked transfers against the local ssh/sftp server of the benchmarks
+
+Usage::
+
+    $ python -m pytest tests
+
+'''
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from ssh_paramiko import RemoteServer
+from ssh_paramiko.hashing import REMOTE_HASH_COMMANDS
+from server import BenchmarkServer
+
+MB = 1048576
+
+
+class ChunkedTransfersTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.bench = BenchmarkServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bench.close()
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.local_file = os.path.join(self.folder, 'local')
+        self.remote_file = os.path.join(self.folder, 'remote')
+        with open(self.local_file, 'wb') as local_file:
+            local_file.write(os.urandom(8 * MB + 12345))
+        self.remote_server = RemoteServer(None, username='benchmark', password='benchmark',
+                                          ssh_port=self.bench.port, server_has_dns=False)
+        ret, msg = self.remote_server.connect_server('127.0.0.1', ping=False)
+        self.assertTrue(ret, msg)
+
+    def tearDown(self):
+        self.remote_server.close_connection()
+        shutil.rmtree(self.folder)
+
+    def assert_same_content(self, first_path, second_path):
+        with open(first_path, 'rb') as first, open(second_path, 'rb') as second:
+            self.assertTrue(first.read() == second.read())
+
+    def test_put_file_chunked(self):
+        # pipelined writes must be acknowledged before each chunk is hashed remotely
+        for _ in range(3):
+            self.assertTrue(self.remote_server.put_file_chunked(
+                self.local_file, self.remote_file, chunk_size=MB))
+            self.assert_same_content(self.local_file, self.remote_file)
+        self.assertFalse(os.path.exists(self.local_file+'.part.json'))
+
+    def test_put_file_chunked_resumes(self):
+        remote_chunk_checksums = self.remote_server.remote_chunk_checksums
+
+        def fail_chunk_3(remote_file_path, chunk_size, indexes):
+            if indexes == [3]:
+                return {}
+            return remote_chunk_checksums(remote_file_path, chunk_size, indexes)
+        self.remote_server.remote_chunk_checksums = fail_chunk_3
+        self.assertFalse(self.remote_server.put_file_chunked(
+            self.local_file, self.remote_file, chunk_size=MB))
+        self.assertTrue(os.path.exists(self.local_file+'.part.json'))
+        self.remote_server.remote_chunk_checksums = remote_chunk_checksums
+        self.assertTrue(self.remote_server.put_file_chunked(
+            self.local_file, self.remote_file, chunk_size=MB))
+        self.assert_same_content(self.local_file, self.remote_file)
+
+    def test_get_file_chunked(self):
+        shutil.copy(self.local_file, self.remote_file)
+        downloaded_file = os.path.join(self.folder, 'downloaded')
+        self.assertTrue(self.remote_server.get_file_chunked(
+            downloaded_file, self.remote_file, chunk_size=MB))
+        self.assert_same_content(self.remote_file, downloaded_file)
+
+    def test_chunked_without_remote_hash_command(self):
+        # the chunks are read back through sftp instead of failing after the transfer
+        self.remote_server.hash_algorithm = 'sha224'
+        self.assertTrue(self.remote_server.put_file_chunked(
+            self.local_file, self.remote_file, chunk_size=MB))
+        self.assert_same_content(self.local_file, self.remote_file)
+        downloaded_file = os.path.join(self.folder, 'downloaded')
+        with mock.patch.dict(REMOTE_HASH_COMMANDS, {'sha224': 'missing-sha224sum'}):
+            self.assertTrue(self.remote_server.get_file_chunked(
+                downloaded_file, self.remote_file, chunk_size=MB))
+        self.assert_same_content(self.remote_file, downloaded_file)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+''' Commands against the local ssh/sftp server of the benchmarks
+
+Usage::
+
+    $ python -m pytest tests
+
+'''
+import os
+import sys
+import threading
+import unittest
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from ssh_paramiko import RemoteServer
+from ssh_paramiko.hostkeys import KnownHostsStore
+from server import BenchmarkServer
+
+
+class CommandsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.bench = BenchmarkServer()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bench.close()
+
+    def setUp(self):
+        self.remote_server = RemoteServer(None, username='benchmark', password='benchmark',
+                                          ssh_port=self.bench.port, server_has_dns=False,
+                                          known_hosts=KnownHostsStore())
+        ret, msg = self.remote_server.connect_server('127.0.0.1', ping=False)
+        self.assertTrue(ret, msg)
+
+    def tearDown(self):
+        self.remote_server.close_connection()
+
+    def test_execute_cmd_from_many_threads(self):
+        # e.g. the chunk checksums of the transfer workers share the instance
+        expected = {'true': 0, 'exit 3': 3}
+        results = []
+        barrier = threading.Barrier(8)
+
+        def run(cmd):
+            barrier.wait()
+            for _ in range(10):
+                results.append((cmd, self.remote_server.execute_cmd(cmd, with_status=True)[3]))
+        threads = [threading.Thread(target=run, args=(cmd,))
+                   for cmd in list(expected) * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 80)
+        self.assertEqual([(cmd, status) for cmd, status in results if expected[cmd] != status],
+                         [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+''' Known hosts checks against the local ssh/sftp server of the benchmarks
+
+Usage::
+
+    $ python -m pytest tests
+
+'''
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import paramiko
+from ssh_paramiko import RemoteServer
+from ssh_paramiko.hostkeys import KnownHostsPolicy, KnownHostsStore, host_key_name
+from server import BenchmarkServer
+
+
+class KnownHostsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.bench = BenchmarkServer()
+        cls.hostname = host_key_name('127.0.0.1', cls.bench.port)
+        cls.other_key = paramiko.RSAKey.generate(1024)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bench.close()
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.known_hosts_path = os.path.join(self.folder, 'known_hosts')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def connect(self, store, **kwargs):
+        remote_server = RemoteServer(None, username='benchmark', password='benchmark',
+                                     ssh_port=self.bench.port, known_hosts=store, **kwargs)
+        ret, _ = remote_server.connect_server('127.0.0.1', ping=False)
+        remote_server.close_connection()
+        return ret
+
+    def test_unknown_key_stored_once_verified(self):
+        store = KnownHostsStore()
+        policy = KnownHostsPolicy(store)
+        self.assertFalse(policy.verify(self.hostname, self.bench.host_key))
+        self.assertEqual(store.lookup(self.hostname), {})
+        policy.confirm()
+        self.assertTrue(store.check(self.hostname, self.bench.host_key))
+        self.assertTrue(policy.verify(self.hostname, self.bench.host_key))
+        self.assertEqual(policy.last_match, self.hostname)
+
+    def test_connection_stores_unknown_key(self):
+        store = KnownHostsStore()
+        self.assertTrue(self.connect(store, server_has_dns=False))
+        self.assertTrue(store.check(self.hostname, self.bench.host_key))
+
+    def test_failed_hostname_check_leaves_store_unchanged(self):
+        # the stub server answers with the name of the local host, not 127.0.0.1
+        store = KnownHostsStore(self.known_hosts_path, batch_size=1)
+        self.assertFalse(self.connect(store, server_has_dns=True))
+        self.assertEqual(store.lookup(self.hostname), {})
+        self.assertFalse(os.path.exists(self.known_hosts_path))
+
+    def test_changed_key_rejected(self):
+        store = KnownHostsStore()
+        store.add(self.hostname, self.other_key)
+        with self.assertRaises(paramiko.BadHostKeyException):
+            KnownHostsPolicy(store).verify(self.hostname, self.bench.host_key)
+        self.assertFalse(self.connect(store, server_has_dns=False))
+        self.assertTrue(store.check(self.hostname, self.other_key))
+
+    def test_unknown_host_rejected(self):
+        store = KnownHostsStore()
+        self.assertFalse(self.connect(store, server_has_dns=False, reject_unknown_hosts=True))
+        self.assertEqual(store.lookup(self.hostname), {})
+
+    def test_hashed_entry_matches(self):
+        with open(self.known_hosts_path, 'w') as known_hosts:
+            known_hosts.write(paramiko.hostkeys.HostKeyEntry(
+                [paramiko.HostKeys.hash_host(self.hostname)], self.bench.host_key).to_line())
+        store = KnownHostsStore(self.known_hosts_path)
+        self.assertTrue(self.connect(store, server_has_dns=False, reject_unknown_hosts=True))
+        self.assertTrue(store.check(self.hostname, self.bench.host_key))
+
+    def test_batched_hashed_append(self):
+        store = KnownHostsStore(self.known_hosts_path, hash_hostnames=True, batch_size=2)
+        store.add(self.hostname, self.bench.host_key)
+        self.assertFalse(os.path.exists(self.known_hosts_path))
+        store.add('other', self.other_key)
+        with open(self.known_hosts_path) as known_hosts:
+            lines = known_hosts.readlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(all(line.startswith('|1|') for line in lines))
+        store = KnownHostsStore(self.known_hosts_path)
+        self.assertTrue(store.check(self.hostname, self.bench.host_key))
+        self.assertTrue(store.check('other', self.other_key))
+
+    def test_pending_keys_written_at_exit(self):
+        # a store created directly, not through get_known_hosts
+        subprocess.check_call([sys.executable, '-c', '''if True:
+            import sys
+            sys.path.insert(0, sys.argv[1])
+            import paramiko
+            from ssh_paramiko.hostkeys import KnownHostsStore
+            KnownHostsStore(sys.argv[2]).add('other', paramiko.RSAKey.generate(1024))
+            ''', ROOT, self.known_hosts_path])
+        self.assertTrue(KnownHostsStore(self.known_hosts_path).lookup('other'))
+
+
+if __name__ == '__main__':
+    unittest.main()
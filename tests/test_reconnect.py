@@ -0,0 +1,120 @@
+#!/usr/bin/python
+''' Lost connections against the local ssh/sftp server of the benchmarks
+
+Usage::
+
+    $ python -m pytest tests
+
+'''
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from ssh_paramiko import RemoteServer
+from ssh_paramiko.hostkeys import KnownHostsStore
+from server import BenchmarkServer
+
+
+def break_transport(transport):
+    '''Fails the socket of a transport, as a network failure would, until it is inactive'''
+    transport.sock.shutdown(socket.SHUT_RDWR)
+    deadline = time.time() + 5
+    while transport.is_active() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class ReconnectTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.bench = BenchmarkServer()
+        cls.known_hosts = KnownHostsStore()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.bench.close()
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def connect(self, **kwargs):
+        remote_server = RemoteServer(None, username='benchmark', password='benchmark',
+                                     ssh_port=self.bench.port, server_has_dns=False,
+                                     known_hosts=self.known_hosts, retry_backoff=0.01,
+                                     **kwargs)
+        ret, msg = remote_server.connect_server('127.0.0.1', ping=False)
+        self.assertTrue(ret, msg)
+        self.addCleanup(remote_server.close_connection)
+        return remote_server
+
+    def test_idempotent_command_after_lost_transport(self):
+        remote_server = self.connect()
+        break_transport(remote_server.transport)
+        self.assertEqual(remote_server.execute_cmd('echo run', idempotent=True),
+                         (True, 'run\n', ''))
+        self.assertEqual(remote_server.reconnect_count, 1)
+        self.assertTrue(remote_server.is_connected())
+
+    def run_interrupted(self, remote_server, idempotent):
+        '''Runs a command whose transport fails while it runs, returning its result and runs'''
+        runs_path = os.path.join(self.folder, 'runs')
+        timer = threading.Timer(0.5, break_transport, (remote_server.transport,))
+        timer.start()
+        try:
+            ret, _, _ = remote_server.execute_cmd('echo run >> '+runs_path+'; sleep 1',
+                                                  idempotent=idempotent)
+        finally:
+            timer.join()
+        # a command sent again would have written to the file by now
+        time.sleep(1)
+        with open(runs_path) as runs:
+            return ret, len(runs.readlines())
+
+    def test_interrupted_command_not_sent_again(self):
+        remote_server = self.connect()
+        self.assertEqual(self.run_interrupted(remote_server, False), (False, 1))
+        self.assertEqual(remote_server.reconnect_count, 0)
+
+    def test_interrupted_idempotent_command_sent_again(self):
+        remote_server = self.connect()
+        self.assertEqual(self.run_interrupted(remote_server, True), (True, 2))
+        self.assertEqual(remote_server.reconnect_count, 1)
+
+    def test_no_retries(self):
+        remote_server = self.connect(retries=0)
+        break_transport(remote_server.transport)
+        ret, _, _ = remote_server.execute_cmd('echo run', idempotent=True)
+        self.assertFalse(ret)
+        self.assertEqual(remote_server.reconnect_count, 0)
+        self.assertFalse(remote_server.is_connected())
+
+    def test_put_file_after_lost_sftp_transport(self):
+        remote_server = self.connect()
+        local_file_path = os.path.join(self.folder, 'local')
+        remote_file_path = os.path.join(self.folder, 'remote')
+        with open(local_file_path, 'wb') as local_file:
+            local_file.write(os.urandom(1048576))
+        transport, sftp_transport = remote_server.transport, remote_server.sftp_transport
+        break_transport(sftp_transport)
+        self.assertTrue(remote_server.put_file(local_file_path, remote_file_path))
+        self.assertEqual(remote_server.reconnect_count, 1)
+        # both transports are dropped and opened again
+        self.assertIsNot(remote_server.transport, transport)
+        self.assertIsNot(remote_server.sftp_transport, sftp_transport)
+        self.assertTrue(remote_server.is_connected())
+        with open(local_file_path, 'rb') as local_file, open(remote_file_path, 'rb') as remote:
+            self.assertTrue(local_file.read() == remote.read())
+
+
+if __name__ == '__main__':
+    unittest.main()